@@ -1,9 +1,13 @@
 import streamlit as st
 import asyncio
-import pdfplumber
-from data_extractor import extract_info_with_groq
-from sentence_transformers import SentenceTransformer
+import config
+from cv_parser import iter_pdf_pages
+from data_extractor import extract_info_with_groq_stream
+import metrics
+import resources
+from rule_extractor import quick_screen
 import logging
+import uuid
 
 # Configurer les logs
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,47 +15,79 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Configure an independent event loop to avoid conflicts with PyTorch
 asyncio.set_event_loop(asyncio.new_event_loop())
 
-# Initialisation de embedding_model après le démarrage de Streamlit
+# Modèle chargé une seule fois par processus, et non à chaque rerun Streamlit
+@st.cache_resource(show_spinner="Chargement du modèle d'embedding...")
+def load_embedding_model():
+    return resources.get_embedding_model()
+
 embedding_model = None
 try:
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    logging.info("embedding_model initialisé avec succès.")
+    embedding_model = load_embedding_model()
 except Exception as e:
     logging.error(f"Erreur lors de l'initialisation de embedding_model : {e}")
     st.error(f"Erreur lors de l'initialisation de l'encodeur de texte : {e}")
     st.stop()
 
+# Namespace de l'index vectoriel propre à la session : les segments d'un autre recruteur ne s'y mélangent pas
+if "index_namespace" not in st.session_state:
+    st.session_state["index_namespace"] = uuid.uuid4().hex
+
 # Interface Streamlit
 st.title("Analyseur de CV - JESA")
 st.write("Téléversez un CV au format PDF pour extraire les informations pertinentes.")
 
 # Téléversement du fichier
 uploaded_file = st.file_uploader("Choisir un fichier PDF", type="pdf")
+quick_mode = st.checkbox("Tri rapide : coordonnées et dates uniquement, sans appel au LLM")
 
 if uploaded_file is not None:
     try:
         # Extraire le texte du PDF
         logging.info(f"Traitement de {uploaded_file.name}")
-        with pdfplumber.open(uploaded_file) as pdf:
-            cv_text = "\n".join(page.extract_text() for page in pdf.pages if page.extract_text())
-        
-        # Afficher le texte extrait
         st.subheader("Texte extrait du CV")
-        st.text_area("Texte brut", cv_text, height=200)
-
-        # Extraire les informations avec Groq
-        query = "Extract information from this CV"
-        extracted_info = extract_info_with_groq(cv_text, query, embedding_model)
-
-        # Afficher les résultats
-        st.subheader("Informations extraites")
-        if "Erreur" in extracted_info:
-            st.error(f"Erreur lors de l'extraction : {extracted_info['Erreur']}")
-            if "Repaired" in extracted_info:
-                st.write("Données réparées :")
-                st.json(extracted_info["Repaired"])
+        text_placeholder = st.empty()
+        pages = []
+        with metrics.span("pdf_parse"):
+            for page_text in iter_pdf_pages(uploaded_file.getvalue(), config.PDF_MAX_PAGES, config.PDF_TIMEOUT, config.PDF_PAGE_WORKERS):
+                pages.append(page_text)
+                text_placeholder.text(f"{len(pages)} page(s) extraite(s)...")
+        cv_text = "\n".join(pages)
+
+        # Afficher le texte extrait
+        text_placeholder.text_area("Texte brut", cv_text, height=200)
+
+        if quick_mode:
+            st.subheader("Coordonnées (tri rapide)")
+            st.json(quick_screen(cv_text))
         else:
-            st.json(extracted_info)
+            # Extraire les informations avec Groq
+            query = "Extract information from this CV"
+            namespace = st.session_state["index_namespace"]
+            # Un seul CV actif par session : les précédents sont retirés de l'index
+            resources.get_vector_index().delete(namespace=namespace, delete_all=True)
+            st.subheader("Informations extraites")
+            fields_placeholder = st.empty()
+            stream = extract_info_with_groq_stream(cv_text, query, embedding_model, file_name=uploaded_file.name, namespace=namespace)
+            # Chaque champ est affiché dès que Groq a fini de l'écrire
+            partial_info = {}
+            for field, value in stream:
+                partial_info[field] = value
+                fields_placeholder.json(partial_info)
+            extracted_info = stream.result
+
+            # Afficher les résultats
+            if "Erreur" in extracted_info:
+                fields_placeholder.empty()
+                st.error(f"Erreur lors de l'extraction : {extracted_info['Erreur']}")
+                if "Repaired" in extracted_info:
+                    st.write("Données réparées :")
+                    st.json(extracted_info["Repaired"])
+            else:
+                fields_placeholder.json(extracted_info)
+
+        metrics.increment("cv_processed")
+        if config.METRICS_EXPORT_PATH:
+            metrics.registry.export(config.METRICS_EXPORT_PATH)
 
     except Exception as e:
         logging.error(f"Erreur lors du traitement du CV : {e}")
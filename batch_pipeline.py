@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Iterator, List, Tuple
+
+import candidate_export
+import config
+import cv_parser
+import data_extractor
+import metrics
+import resources
+import rule_extractor
+from data_processor import CompiledCriteria, compile_criteria, structure_candidate_data
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_QUERY = "Extract information from this CV"
+
+_DONE = object()
+
+
+def iter_pdf_sources(source: str) -> Iterator[Tuple[str, bytes]]:
+    """Yield (file_name, pdf_bytes) from a directory, a .zip or a tar archive."""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith('.pdf'):
+                    path = os.path.join(root, name)
+                    with open(path, 'rb') as f:
+                        yield os.path.relpath(path, source), f.read()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith('.pdf'):
+                    yield info.filename, archive.read(info)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith('.pdf'):
+                    yield member.name, archive.extractfile(member).read()
+    elif source.lower().endswith('.pdf'):
+        with open(source, 'rb') as f:
+            yield os.path.basename(source), f.read()
+    else:
+        raise ValueError(f"Source non supportée : {source}")
+
+
+def _collect_parsed(pending: Dict[Any, str], parsed_queue: queue.Queue, return_when: str):
+    done, _ = wait(pending, return_when=return_when)
+    for future in done:
+        file_name = pending.pop(future)
+        try:
+            text, elapsed = future.result()
+            metrics.observe("pdf_parse", elapsed)
+            parsed_queue.put((file_name, text))
+        except Exception as e:
+            logging.error(f"Erreur lors du parsing de {file_name} : {e}")
+            parsed_queue.put((file_name, ""))
+
+
+def _parse_stage(sources: Iterator[Tuple[str, bytes]], parse_workers: int, window: int, parsed_queue: queue.Queue):
+    try:
+        # spawn plutôt que fork : le processus parent héberge déjà les threads de torch
+        with ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            pending = {}
+            for file_name, content in sources:
+                pending[pool.submit(cv_parser.read_pdf_timed, content, config.PDF_MAX_PAGES, config.PDF_TIMEOUT)] = file_name
+                if len(pending) >= window:
+                    _collect_parsed(pending, parsed_queue, FIRST_COMPLETED)
+            while pending:
+                _collect_parsed(pending, parsed_queue, FIRST_COMPLETED)
+    except Exception as e:
+        logging.error(f"Erreur dans l'étape de parsing : {e}", exc_info=True)
+    finally:
+        parsed_queue.put(_DONE)
+
+
+def _embed_stage(parsed_queue: queue.Queue, llm_queue: queue.Queue, embedding_model, embed_batch_size: int):
+    finished = False
+    try:
+        while not finished:
+            batch = []
+            item = parsed_queue.get()
+            while item is not _DONE:
+                batch.append(item)
+                if len(batch) >= embed_batch_size:
+                    break
+                try:
+                    item = parsed_queue.get_nowait()
+                except queue.Empty:
+                    break
+            finished = item is _DONE
+            if not batch:
+                continue
+            try:
+                data_extractor.index_cv_batch([(name, text) for name, text in batch if text], embedding_model, embed_batch_size)
+            except Exception as e:
+                logging.error(f"Erreur lors de l'indexation d'un lot de {len(batch)} CV : {e}")
+            for item in batch:
+                llm_queue.put(item)
+    finally:
+        llm_queue.put(_DONE)
+
+
+async def _extract_candidate(file_name: str, cv_text: str, embedding_model, query: str, criteria: CompiledCriteria, quick_screen: bool) -> Dict[str, Any]:
+    if not cv_text.strip():
+        return {"Erreur": "Aucun texte extrait du PDF"}
+    if quick_screen:
+        return rule_extractor.quick_screen(cv_text)
+    extracted_info = await data_extractor.extract_info_from_index_async(cv_text, query, embedding_model)
+    if "Erreur" in extracted_info:
+        return extracted_info
+    data_extractor.tag_document(file_name, extracted_info)
+    return structure_candidate_data(extracted_info, criteria, file_name)
+
+
+async def _llm_stage_async(llm_queue: queue.Queue, results_queue: queue.Queue, embedding_model, query: str, criteria: CompiledCriteria,
+                           quick_screen: bool, llm_concurrency: int):
+    slots = asyncio.Semaphore(llm_concurrency)
+    tasks = set()
+
+    async def process(file_name: str, cv_text: str):
+        try:
+            candidate = await _extract_candidate(file_name, cv_text, embedding_model, query, criteria, quick_screen)
+        except Exception as e:
+            # Un CV en échec ne doit pas arrêter l'étape : le consommateur attend son résultat
+            logging.error(f"Erreur lors de l'analyse de {file_name} : {e}", exc_info=True)
+            candidate = {"Erreur": str(e)}
+        finally:
+            slots.release()
+        metrics.increment("cv_processed")
+        results_queue.put({"file_name": file_name, "candidate": candidate})
+
+    while True:
+        await slots.acquire()
+        item = await asyncio.to_thread(llm_queue.get)
+        if item is _DONE:
+            break
+        task = asyncio.create_task(process(*item))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+
+
+def _llm_stage(llm_queue: queue.Queue, results_queue: queue.Queue, embedding_model, query: str, criteria: CompiledCriteria,
+               quick_screen: bool, llm_concurrency: int):
+    """Extract up to ``llm_concurrency`` CVs at a time on one event loop.
+
+    Groq calls go through the shared rate limiter (requests/min, tokens/min,
+    backoff on 429), so a batch uses the whole quota without exceeding it.
+    """
+    try:
+        asyncio.run(_llm_stage_async(llm_queue, results_queue, embedding_model, query, criteria, quick_screen, llm_concurrency))
+    except Exception as e:
+        logging.error(f"Erreur dans l'étape d'extraction : {e}", exc_info=True)
+    finally:
+        results_queue.put(_DONE)
+
+
+def process_batch(source: str, embedding_model, criteria: Dict[str, Any] = None, query: str = DEFAULT_QUERY,
+                  parse_workers: int = None, embed_batch_size: int = 32, llm_concurrency: int = 4,
+                  queue_size: int = 64, quick_screen: bool = False) -> Iterator[Dict[str, Any]]:
+    """Run parse, embed and LLM extraction stages concurrently, yielding results as they finish.
+
+    PDFs are parsed in a process pool, segments are embedded in batches, and up
+    to ``llm_concurrency`` Groq extractions run concurrently on an event loop,
+    scheduled under the Groq quota by the rate limiter. Stages are connected by
+    bounded queues so memory stays flat whatever the size of the source.
+    ``quick_screen`` replaces the Groq extraction by the rule-based contact screen.
+    """
+    # Critères compilés une seule fois pour tout le lot, pas à chaque CV
+    criteria = compile_criteria(criteria or {})
+    parse_workers = parse_workers or os.cpu_count() or 1
+    parsed_queue = queue.Queue(maxsize=queue_size)
+    llm_queue = queue.Queue(maxsize=queue_size)
+    results_queue = queue.Queue()
+
+    threads = [
+        threading.Thread(target=_parse_stage, args=(iter_pdf_sources(source), parse_workers, parse_workers * 2, parsed_queue), daemon=True),
+        threading.Thread(target=_embed_stage, args=(parsed_queue, llm_queue, embedding_model, embed_batch_size), daemon=True),
+        threading.Thread(target=_llm_stage, args=(llm_queue, results_queue, embedding_model, query, criteria, quick_screen, llm_concurrency), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    while True:
+        result = results_queue.get()
+        if result is _DONE:
+            break
+        yield result
+    for thread in threads:
+        thread.join()
+
+
+def run_batch(source: str, output_path: str, embedding_model, metrics_path: str = None, parquet_dir: str = None, **kwargs) -> List[str]:
+    """Write one JSON line per CV to ``output_path`` and return the processed file names.
+
+    Stage latencies and counters are exported to ``metrics_path`` (or
+    ``config.METRICS_EXPORT_PATH``) at the end of the run. With ``parquet_dir``,
+    structured candidates are also streamed to a partitioned Parquet dataset
+    (see ``candidate_export``).
+    """
+    processed = []
+    parquet = None
+    if parquet_dir and not kwargs.get("quick_screen"):
+        parquet = candidate_export.CandidateParquetWriter(parquet_dir, batch_size=config.PARQUET_EXPORT_BATCH_SIZE)
+    try:
+        with open(output_path, 'w', encoding='utf-8') as output:
+            for result in process_batch(source, embedding_model, **kwargs):
+                output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                output.flush()
+                if parquet is not None:
+                    parquet.write(result["file_name"], result["candidate"])
+                processed.append(result["file_name"])
+                logging.info(f"CV traité ({len(processed)}) : {result['file_name']}")
+    finally:
+        if parquet is not None:
+            parquet.close()
+            logging.info(f"{parquet.rows_written} candidats exportés en Parquet dans {parquet_dir}")
+    data_extractor.save_index()
+    metrics_path = metrics_path or config.METRICS_EXPORT_PATH
+    if metrics_path:
+        metrics.registry.export(metrics_path)
+        logging.info(f"Métriques écrites dans {metrics_path}")
+    return processed
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Analyse en lot de CV (répertoire, .zip ou .tar de PDF).")
+    parser.add_argument("source", help="Répertoire ou archive contenant les CV au format PDF")
+    parser.add_argument("-o", "--output", default="candidates.jsonl", help="Fichier JSONL de sortie")
+    parser.add_argument("--criteria", help="Fichier JSON des critères du recruteur")
+    parser.add_argument("--query", default=DEFAULT_QUERY)
+    parser.add_argument("--parse-workers", type=int, default=None)
+    parser.add_argument("--embed-batch-size", type=int, default=32)
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--quick-screen", action="store_true", help="Coordonnées et dates par règles uniquement, sans appel au LLM")
+    parser.add_argument("--metrics", help="Export des métriques par étape (.prom pour Prometheus, sinon JSON)")
+    parser.add_argument("--parquet", help="Répertoire du jeu Parquet partitionné des candidats structurés")
+    args = parser.parse_args(argv)
+
+    criteria = {}
+    if args.criteria:
+        with open(args.criteria, encoding='utf-8') as f:
+            criteria = json.load(f)
+
+    embedding_model = resources.get_embedding_model()
+
+    processed = run_batch(args.source, args.output, embedding_model, metrics_path=args.metrics, parquet_dir=args.parquet, criteria=criteria, query=args.query,
+                          parse_workers=args.parse_workers, embed_batch_size=args.embed_batch_size,
+                          llm_concurrency=args.llm_concurrency, queue_size=args.queue_size, quick_screen=args.quick_screen)
+    logging.info(f"{len(processed)} CV traités, résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
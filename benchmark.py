@@ -0,0 +1,350 @@
+"""Offline end-to-end benchmark of the CV pipeline.
+
+Generates synthetic CV PDFs, swaps in a deterministic embedding model, a local
+fake Groq endpoint and a Pinecone stand-in, then reports per-stage throughput
+and p50/p95/p99 latency as JSON:
+
+    python benchmark.py --cvs 50 --llm-latency 0.2 --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+import numpy as np
+
+# Objectif de démarrage à froid : import des modules du pipeline, sans modèle ni client
+STARTUP_TARGET_S = 1.0
+STARTUP_SNIPPET = "import time; t = time.perf_counter(); import data_extractor, data_processor, cv_parser, vector_store; print(time.perf_counter() - t)"
+
+FIRST_NAMES = ["Fadoua", "Youssef", "Salma", "Omar", "Imane", "Karim", "Nadia", "Mehdi"]
+LAST_NAMES = ["Mady", "Benali", "Alaoui", "Idrissi", "Tazi", "Berrada", "Chraibi", "Fassi"]
+COMPANIES = ["OCP", "JESA", "ONEE", "Lydec", "Managem", "Marsa Maroc", "Alstom", "Siemens"]
+POSTES = ["Ingenieur electrique", "Superviseur construction", "Data analyst", "Ingenieur process", "Technicien maintenance"]
+SKILLS = ["Python", "SQL", "AutoCAD", "Primavera", "SAP", "Power BI", "Excel", "MATLAB", "Revit", "Machine Learning"]
+SCHOOLS = ["EMI", "ENSIAS", "EHTP", "ENSAM", "INSEA", "FST Settat"]
+DIPLOMAS = ["bac+2", "bac+3", "bac+5", "master", "doctorat"]
+
+
+class FakeEmbeddingModel:
+    """Deterministic stand-in for SentenceTransformer: vectors seeded by a hash of the text."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        if isinstance(texts, str):
+            return self._vector(texts)
+        return np.stack([self._vector(text) for text in texts]) if texts else np.empty((0, self.dim), dtype=np.float32)
+
+
+def synthetic_profile(rng: random.Random) -> Dict[str, Any]:
+    start = rng.randint(2005, 2020)
+    return {
+        "nom": rng.choice(LAST_NAMES), "prenom": rng.choice(FIRST_NAMES),
+        "email": f"candidat{rng.randint(1, 99999)}@example.com", "telephone": f"+2126{rng.randint(10000000, 99999999)}",
+        "age": rng.randint(22, 55), "date_naissance": str(rng.randint(1970, 2002)), "genre": "", "nationalite": None,
+        "grade": rng.choice(["construction engineer", "construction manager", ""]), "discipline": rng.choice(["Electrical", "Civil", "data et ia"]),
+        "diplomes": [{"nom_diplome": rng.choice(DIPLOMAS), "etablissement": rng.choice(SCHOOLS), "annee_obtention": str(start - 1), "statut": "obtenu"}],
+        "stages": [],
+        "experiences_professionnelles": [{"entreprise": rng.choice(COMPANIES), "poste": rng.choice(POSTES), "date_debut": str(start), "date_fin": str(min(start + rng.randint(1, 8), 2025)),
+                                          "emplacement": rng.choice(["Casablanca", "Safi", "Jorf Lasfar"]), "description": "Suivi de chantier et maintenance energie"}],
+        "competences_cles": rng.sample(SKILLS, 4), "soft_skills": ["Rigueur"], "profil": rng.choice(POSTES),
+    }
+
+
+def synthetic_cv_pages(rng: random.Random, pages: int) -> List[List[str]]:
+    """Lines of a synthetic CV spread over ``pages`` pages; empty lines separate its sections."""
+    header = [f"{rng.choice(LAST_NAMES).upper()} {rng.choice(FIRST_NAMES)}", f"candidat{rng.randint(1, 99999)}@example.com",
+              f"+212 6{rng.randint(10, 99)} {rng.randint(100, 999)} {rng.randint(100, 999)}", f"Ne le {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1970, 2002)}", ""]
+    result = []
+    for page in range(pages):
+        lines = list(header) if page == 0 else []
+        for _ in range(rng.randint(4, 8)):
+            start = rng.randint(2005, 2020)
+            lines += [f"{rng.choice(POSTES)} - {rng.choice(COMPANIES)} ({start} - {start + rng.randint(1, 5)})",
+                      "Suivi des travaux, coordination des equipes et reporting hebdomadaire.",
+                      f"Competences : {', '.join(rng.sample(SKILLS, 3))}", ""]
+        lines += [f"Formation : {rng.choice(DIPLOMAS)} - {rng.choice(SCHOOLS)}", f"Mention {rng.choice(['assez bien', 'bien', 'tres bien'])}", ""]
+        result.append(lines)
+    return result
+
+
+def build_pdf(pages: List[List[str]]) -> bytes:
+    """Minimal single-font PDF writer, enough for pdfplumber to extract the lines.
+
+    An empty line leaves a vertical gap, read back as a paragraph break.
+    """
+    objects = {1: "<< /Type /Catalog /Pages 2 0 R >>", 3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"}
+    kids = []
+    number = 4
+    for lines in pages:
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = "BT /F1 10 Tf 50 800 Td 13 TL " + " ".join(f"({line}) '" for line in escaped) + " ET"
+        objects[number] = f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {number + 1} 0 R /Resources << /Font << /F1 3 0 R >> >> >>"
+        objects[number + 1] = f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream"
+        kids.append(number)
+        number += 2
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>"
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for key in sorted(objects):
+        offsets[key] = len(output)
+        output += f"{key} 0 obj\n{objects[key]}\nendobj\n".encode("latin-1")
+    xref = len(output)
+    output += f"xref\n0 {number}\n0000000000 65535 f \n".encode()
+    output += "".join(f"{offsets[key]:010d} 00000 n \n" for key in range(1, number)).encode()
+    output += f"trailer\n<< /Size {number} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(output)
+
+
+class _FakeGroqHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+        time.sleep(self.latency)
+        with self.lock:
+            content = json.dumps(synthetic_profile(self.rng), ensure_ascii=False)
+        if body.get("stream"):
+            self._stream(body, content)
+            return
+        response = {"id": "bench", "object": "chat.completion", "created": int(time.time()), "model": body.get("model", ""),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": len(str(body)) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(str(body)) + len(content)) // 4}}
+        data = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, body: Dict[str, Any], content: str, chunk_size: int = 16):
+        """Server-sent events in the chat.completion.chunk format; ``latency`` is the time to the first token."""
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("cache-control", "no-cache")
+        self.end_headers()
+        for start in range(0, len(content) + 1, chunk_size):
+            last = start + chunk_size > len(content)
+            chunk = {"id": "bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", ""),
+                     "choices": [{"index": 0, "delta": {"content": content[start:start + chunk_size]}, "finish_reason": "stop" if last else None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_fake_groq_server(latency: float):
+    handler = type("FakeGroqHandler", (_FakeGroqHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _install_offline_stand_ins(groq_url: str):
+    os.environ["GROQ_BASE_URL"] = groq_url
+    os.environ["GROQ_API_KEY"] = "offline-benchmark"
+    os.environ["EXTRACTION_CACHE_PATH"] = ""
+    # Le faux serveur n'impose pas de quota : celui du limiteur reste réglable par l'environnement
+    os.environ.setdefault("GROQ_REQUESTS_PER_MINUTE", "100000")
+    os.environ.setdefault("GROQ_TOKENS_PER_MINUTE", "100000000")
+    os.environ.pop("VECTOR_STORE_PATH", None)
+    pinecone = types.ModuleType("pinecone")
+    pinecone.Pinecone = lambda **kwargs: None
+    pinecone.ServerlessSpec = lambda **kwargs: None
+    sys.modules["pinecone"] = pinecone
+
+
+class StageRecorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.wall: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        samples = self.samples.setdefault(name, [])
+        start = time.perf_counter()
+        yield samples
+        self.wall[name] = time.perf_counter() - start
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for name, samples in self.samples.items():
+            latencies = np.asarray(samples) * 1000
+            result[name] = {
+                "count": len(samples),
+                "wall_s": round(self.wall.get(name, 0.0), 4),
+                "throughput_per_s": round(len(samples) / self.wall[name], 2) if self.wall.get(name) else None,
+                "mean_ms": round(float(latencies.mean()), 3) if len(samples) else None,
+                **{f"p{q}_ms": round(float(np.percentile(latencies, q)), 3) if len(samples) else None for q in (50, 95, 99)},
+            }
+        return result
+
+
+def _timed(samples: List[float], func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+async def _extract_all_async(samples: List[float], texts: List[str], embedding_model) -> List[dict]:
+    import data_extractor
+
+    async def timed(text: str) -> dict:
+        start = time.perf_counter()
+        result = await data_extractor.extract_info_from_index_async(text, "Extract information from this CV", embedding_model)
+        samples.append(time.perf_counter() - start)
+        return result
+    return await asyncio.gather(*(timed(text) for text in texts))
+
+
+def measure_startup(repeats: int = 3) -> Dict[str, Any]:
+    """Cold-import time of the pipeline modules, each run in a fresh interpreter."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    timings = [float(subprocess.run([sys.executable, "-c", STARTUP_SNIPPET], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1])
+               for _ in range(repeats)]
+    median = statistics.median(timings)
+    return {"import_s_median": round(median, 4), "import_s_max": round(max(timings), 4), "target_s": STARTUP_TARGET_S, "target_met": median <= STARTUP_TARGET_S}
+
+
+def run_benchmark(n_cvs: int = 30, max_pages: int = 3, llm_latency: float = 0.05, queries: int = 50,
+                  real_embedding: bool = False, seed: int = 0) -> Dict[str, Any]:
+    startup = measure_startup()
+    server, url = start_fake_groq_server(llm_latency)
+    _install_offline_stand_ins(url)
+    import json_repair
+    import cv_parser
+    import data_extractor
+    import metrics
+    import vector_store
+    from data_processor import compile_criteria, structure_candidate_data
+
+    import resources
+    from llm_cache import ExtractionCache
+    from near_duplicates import NearDuplicateIndex
+    if not real_embedding:
+        resources.get_embedding_model.override(FakeEmbeddingModel())
+    embedding_model = resources.get_embedding_model()
+
+    rng = random.Random(seed)
+    pdfs = [build_pdf(synthetic_cv_pages(rng, rng.randint(1, max_pages))) for _ in range(n_cvs)]
+    recorder = StageRecorder()
+    criteria = {"grade_active": True, "grade_requirement": "construction engineer", "experience_globale_active": True,
+                "experience_globale_requirement": "entre 2 et 6 ans", "niveau_etudes_active": True, "niveau_etudes_requirement": "bac+5",
+                "secteur_experience_active": True, "secteur_experience_requirement": "energy", "competences_active": True,
+                "competences_requirement": "python, sql"}
+
+    with recorder.stage("cv_parser.read_pdf") as samples:
+        texts = [_timed(samples, cv_parser.read_pdf, pdf) for pdf in pdfs]
+
+    with recorder.stage("data_extractor.index_cv_segments") as samples:
+        for i, text in enumerate(texts):
+            _timed(samples, data_extractor.index_cv_segments, f"cv_{i}", text, embedding_model)
+
+    job_queries = [f"{rng.choice(POSTES)} {', '.join(rng.sample(SKILLS, 2))}" for _ in range(queries)]
+    with recorder.stage("vector_store.retrieve_relevant_segments") as samples:
+        for query in job_queries:
+            _timed(samples, vector_store.retrieve_relevant_segments, query, resources.get_vector_index(), embedding_model)
+
+    with recorder.stage("data_extractor.extract_info_from_index") as samples:
+        extractions = [_timed(samples, data_extractor.extract_info_from_index, text, "Extract information from this CV", embedding_model) for text in texts]
+
+    # Caches vidés : sinon le mode streamé serait servi par les extractions ci-dessus
+    resources.get_extraction_cache.override(ExtractionCache(None, max(n_cvs, 1)))
+    resources.get_near_duplicate_index.override(NearDuplicateIndex())
+    with recorder.stage("data_extractor.extract_info_with_groq_stream") as samples, recorder.stage("data_extractor.stream_first_field") as first_fields:
+        for i, text in enumerate(texts):
+            # Champs pré-remplis par les règles : émis avant tout appel à Groq, exclus de la latence du premier champ
+            prefilled = data_extractor._prefill(text)
+            start = time.perf_counter()
+            first_field = None
+            for field, _ in data_extractor.extract_info_with_groq_stream(text, "Extract information from this CV", embedding_model, file_name=f"cv_{i}"):
+                if first_field is None and field not in prefilled:
+                    first_field = time.perf_counter() - start
+            samples.append(time.perf_counter() - start)
+            if first_field is not None:
+                first_fields.append(first_field)
+
+    # Chemin asynchrone sous quota (limiteur de débit, backoff), celui du traitement par lot
+    resources.get_extraction_cache.override(ExtractionCache(None, max(n_cvs, 1)))
+    resources.get_near_duplicate_index.override(NearDuplicateIndex())
+    with recorder.stage("data_extractor.extract_info_from_index_async") as samples:
+        asyncio.run(_extract_all_async(samples, texts, embedding_model))
+
+    raw_outputs = [json.dumps(synthetic_profile(rng), ensure_ascii=False) for _ in range(n_cvs)]
+    # Sorties LLM typiques à réparer : JSON tronqué et virgules finales
+    raw_outputs += [output[:int(len(output) * 0.8)] for output in raw_outputs[: n_cvs // 2]]
+    raw_outputs += [output.replace("]", ",]") for output in raw_outputs[: n_cvs // 2]]
+    with recorder.stage("json_repair.loads") as samples:
+        for output in raw_outputs:
+            _timed(samples, json_repair.loads, output)
+
+    compiled_criteria = compile_criteria(criteria)
+    with recorder.stage("data_processor.structure_candidate_data") as samples:
+        for i, extraction in enumerate(extractions):
+            _timed(samples, structure_candidate_data, extraction, compiled_criteria, f"cv_{i}")
+
+    server.shutdown()
+    return {
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {"cvs": n_cvs, "max_pages": max_pages, "llm_latency_s": llm_latency, "queries": queries,
+                   "embedding_model": "all-MiniLM-L6-v2" if real_embedding else "fake", "seed": seed},
+        "startup": startup,
+        "errors": sum(1 for extraction in extractions if "Erreur" in extraction),
+        "segments": sum(len(data_extractor.split_segments(text)) for text in texts),
+        "stages": recorder.summary(),
+        # Vue des mêmes étapes par l'instrumentation embarquée (histogrammes, compteurs)
+        "instrumentation": metrics.registry.snapshot(),
+        # Mémoire par vecteur selon VECTOR_STORE_DTYPE (codes parcourus, float32 non sauvegardés, métadonnées)
+        "vector_index": resources.get_vector_index().memory_stats(),
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne du pipeline d'analyse de CV.")
+    parser.add_argument("--cvs", type=int, default=30, help="Nombre de CV synthétiques")
+    parser.add_argument("--max-pages", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Latence simulée du endpoint Groq (s)")
+    parser.add_argument("--queries", type=int, default=50, help="Nombre de requêtes de recherche")
+    parser.add_argument("--real-embedding", action="store_true", help="Utiliser all-MiniLM-L6-v2 au lieu du modèle factice")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Fichier JSON de résultats (stdout par défaut)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    results = run_benchmark(args.cvs, args.max_pages, args.llm_latency, args.queries, args.real_embedding, args.seed)
+    report = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
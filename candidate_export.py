@@ -0,0 +1,208 @@
+"""Columnar export of structured candidates to partitioned Parquet.
+
+Candidates produced by ``structure_candidate_data`` are flattened into typed
+columns (nested experiences and diplomas become list<struct> columns) and
+written in row groups of ``batch_size`` rows, so memory stays bounded however
+many candidates are exported. ``load_candidates`` reads back only the requested
+columns and the row groups and partitions matching the filters.
+
+pyarrow is an optional dependency, imported on first use.
+"""
+import logging
+import os
+import uuid
+from datetime import date
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Critères de score_candidate -> colonnes
+SCORE_COLUMNS = {
+    "Grade": "score_grade",
+    "Expérience globale": "score_experience",
+    "Niveau d'études": "score_niveau_etudes",
+    "Discipline": "score_discipline",
+    "Secteur d'expérience": "score_secteur",
+}
+EXPERIENCE_FIELDS = ("entreprise", "poste", "date_debut", "date_fin", "emplacement", "description")
+STAGE_FIELDS = ("entreprise", "poste", "duree", "emplacement", "description")
+FORMATION_FIELDS = {"Établissement": "etablissement", "Diplôme": "diplome", "Période": "periode", "Statut": "statut"}
+
+_schema = None
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("pyarrow est requis pour l'export Parquet (pip install pyarrow).") from e
+    return pyarrow
+
+
+def candidate_schema():
+    """Arrow schema of an exported candidate row."""
+    global _schema
+    if _schema is None:
+        pa = _pyarrow()
+        struct = lambda fields: pa.list_(pa.struct([(field, pa.string()) for field in fields]))
+        _schema = pa.schema(
+            [("file_name", pa.string()), ("export_date", pa.string()), ("nom_prenom", pa.string()), ("age", pa.int32()),
+             ("genre", pa.string()), ("localisation", pa.string()), ("email", pa.string()), ("telephone", pa.string()),
+             ("date_naissance", pa.string()), ("poste_vise", pa.string()), ("remarque", pa.string()), ("score_total", pa.int32())]
+            + [(column, pa.int32()) for column in SCORE_COLUMNS.values()]
+            + [("badges", pa.list_(pa.string())), ("competences", pa.list_(pa.string())), ("soft_skills", pa.list_(pa.string())),
+               ("formations", struct(FORMATION_FIELDS.values())), ("experiences", struct(EXPERIENCE_FIELDS)), ("stages", struct(STAGE_FIELDS))]
+        )
+    return _schema
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+def _int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _texts(values: Any) -> List[str]:
+    return [_text(value) for value in values if _text(value) is not None] if isinstance(values, list) else []
+
+
+def _records(values: Any, fields: Dict[str, str]) -> List[Dict[str, Optional[str]]]:
+    if not isinstance(values, list):
+        return []
+    return [{column: _text(value.get(key)) for key, column in fields.items()} for value in values if isinstance(value, dict)]
+
+
+def candidate_row(file_name: str, summary: Dict[str, Any], export_date: str = None) -> Optional[Dict[str, Any]]:
+    """Flatten a ``structure_candidate_data`` summary into one row (None for an error summary)."""
+    if not isinstance(summary, dict) or "Erreur" in summary:
+        return None
+    introduction = summary.get("Introduction") or {}
+    score = summary.get("Score") or {}
+    details = score.get("scores") or {}
+    row = {
+        "file_name": file_name,
+        "export_date": export_date or date.today().isoformat(),
+        "nom_prenom": _text(introduction.get("Nom et Prénom")),
+        "age": _int(introduction.get("Âge")),
+        "genre": _text(introduction.get("Genre")),
+        "localisation": _text(introduction.get("Localisation")),
+        "email": _text(summary.get("Email")),
+        "telephone": _text(summary.get("Téléphone")),
+        "date_naissance": _text(summary.get("Date de Naissance")),
+        "poste_vise": _text(score.get("poste_visé")),
+        "remarque": _text(score.get("remarque")),
+        "score_total": _int(score.get("total")),
+        "badges": [_text(badge.get("name")) for badge in score.get("badges") or [] if isinstance(badge, dict) and badge.get("name")],
+        "competences": _texts(summary.get("Compétences Clés")),
+        "soft_skills": _texts(summary.get("Soft Skills")),
+        "formations": _records(summary.get("Formations"), FORMATION_FIELDS),
+        "experiences": _records(summary.get("Expériences Professionnelles"), {field: field for field in EXPERIENCE_FIELDS}),
+        "stages": _records(summary.get("Stages"), {field: field for field in STAGE_FIELDS}),
+    }
+    for criterion, column in SCORE_COLUMNS.items():
+        row[column] = _int(details.get(criterion))
+    return row
+
+
+class CandidateParquetWriter:
+    """Stream candidates into a Hive-partitioned Parquet dataset under ``root``.
+
+    Rows are buffered up to ``batch_size`` and written as one row group per
+    partition; each writer adds its own ``part-<id>.parquet`` file per
+    partition, so successive exports accumulate in the same dataset.
+    """
+
+    def __init__(self, root: str, partition_cols: Sequence[str] = ("export_date",), batch_size: int = 5000, export_date: str = None):
+        self.pa = _pyarrow()
+        self.root = root
+        self.partition_cols = tuple(partition_cols)
+        self.batch_size = batch_size
+        self.export_date = export_date or date.today().isoformat()
+        self.rows_written = 0
+        schema = candidate_schema()
+        self.file_schema = self.pa.schema([field for field in schema if field.name not in self.partition_cols])
+        self._buffer: List[Dict[str, Any]] = []
+        self._writers: Dict[Tuple[Any, ...], Any] = {}
+        self._part = uuid.uuid4().hex[:12]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, file_name: str, summary: Dict[str, Any]) -> bool:
+        """Buffer one candidate; returns False for error summaries, which are skipped."""
+        row = candidate_row(file_name, summary, self.export_date)
+        if row is None:
+            return False
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+        return True
+
+    def _writer(self, partition: Tuple[Any, ...]):
+        writer = self._writers.get(partition)
+        if writer is None:
+            # Encodage URI des valeurs, décodé par le partitionnement Hive de pyarrow à la lecture
+            directory = os.path.join(self.root, *(f"{column}={quote(str(value), safe='') if value is not None else '__HIVE_DEFAULT_PARTITION__'}"
+                                                  for column, value in zip(self.partition_cols, partition)))
+            os.makedirs(directory, exist_ok=True)
+            writer = self._writers[partition] = self.pa.parquet.ParquetWriter(os.path.join(directory, f"part-{self._part}.parquet"), self.file_schema, compression="zstd")
+        return writer
+
+    def flush(self):
+        groups: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = {}
+        for row in self._buffer:
+            groups.setdefault(tuple(row.get(column) for column in self.partition_cols), []).append(row)
+        for partition, rows in groups.items():
+            self._writer(partition).write_table(self.pa.Table.from_pylist(rows, schema=self.file_schema))
+            self.rows_written += len(rows)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+def export_candidates(candidates: Iterable[Tuple[str, Dict[str, Any]]], root: str, **kwargs) -> int:
+    """Write (file_name, summary) pairs to ``root``; returns the number of rows written."""
+    with CandidateParquetWriter(root, **kwargs) as writer:
+        for file_name, summary in candidates:
+            writer.write(file_name, summary)
+    logging.info(f"{writer.rows_written} candidats exportés dans {root}")
+    return writer.rows_written
+
+
+def _dataset(root: str):
+    pa = _pyarrow()
+    return pa.dataset.dataset(root, format="parquet", partitioning="hive")
+
+
+def load_candidates(root: str, columns: List[str] = None, filters=None):
+    """Read the exported candidates as a ``pyarrow.Table``.
+
+    Only ``columns`` are read. ``filters`` (e.g. ``[("score_total", ">=", 60),
+    ("export_date", "=", "2025-06-01")]``, or a pyarrow expression) prune
+    partitions and row groups before anything is decoded. Call ``.to_pandas()``
+    on the result for a DataFrame.
+    """
+    pa = _pyarrow()
+    return pa.parquet.read_table(root, columns=columns, filters=filters, partitioning="hive")
+
+
+def iter_candidate_batches(root: str, columns: List[str] = None, filter_expression=None, batch_size: int = 10000) -> Iterator[Any]:
+    """Stream ``pyarrow.RecordBatch`` objects for datasets too large to load at once."""
+    yield from _dataset(root).to_batches(columns=columns, filter=filter_expression, batch_size=batch_size)
@@ -7,6 +7,73 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY", "gsk_CddZ71i0jSwwRWDjZ7VdWGdyb3FY24v0if
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "us-west1-gcp")
 
+# Répertoire de l'index vectoriel persistant (None = index en mémoire uniquement)
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH")
+# Plafond mémoire des embeddings non sauvegardés ; au-delà, écrits sur disque (ou, sans répertoire, CV les moins récemment utilisés évincés)
+VECTOR_STORE_MAX_MEMORY_MB = float(os.getenv("VECTOR_STORE_MAX_MEMORY_MB", "256"))
+# Codes des segments sauvegardés (float32, float16 ou int8), écrits à côté des .f32 ; sans répertoire, tout reste en float32
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "int8")
+# Recherche de candidats : listes IVF sondées par requête (plus = meilleur rappel, plus lent)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+# Champs extraits rattachés à chaque CV de l'index, utilisables comme filtres de recherche
+DOCUMENT_FILTER_FIELDS = ("discipline", "grade", "nationalite", "competences_cles")
+
+# Modèle Groq utilisé pour l'extraction
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama3-70b-8192")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")
+GROQ_MAX_TOKENS = int(os.getenv("GROQ_MAX_TOKENS", "1024"))
+
+# Budget de tokens en entrée pour le prompt d'extraction (instructions + CV)
+PROMPT_INPUT_TOKEN_BUDGET = int(os.getenv("PROMPT_INPUT_TOKEN_BUDGET", "3000"))
+PROMPT_SEGMENT_MAX_TOKENS = int(os.getenv("PROMPT_SEGMENT_MAX_TOKENS", "200"))
+
+# Quota Groq pour le chemin asynchrone (requêtes et tokens par minute)
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "4"))
+GROQ_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+GROQ_TOKENS_PER_MINUTE = int(os.getenv("GROQ_TOKENS_PER_MINUTE", "6000"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "5"))
+
+# Instrumentation : export des métriques (.prom = format texte Prometheus, sinon JSON)
+METRICS_EXPORT_PATH = os.getenv("METRICS_EXPORT_PATH")
+# Fraction des requêtes dont le prompt complet est journalisé (contient des données personnelles, 0 en production)
+DEBUG_PAYLOAD_SAMPLE_RATE = float(os.getenv("DEBUG_PAYLOAD_SAMPLE_RATE", "0"))
+# Export Parquet des candidats : lignes par groupe de lignes (borne la mémoire de l'écrivain)
+PARQUET_EXPORT_BATCH_SIZE = int(os.getenv("PARQUET_EXPORT_BATCH_SIZE", "5000"))
+
+# Champs (email, téléphone, date de naissance) extraits par règles à partir de cette confiance : plus demandés au LLM
+RULE_CONFIDENCE_THRESHOLD = float(os.getenv("RULE_CONFIDENCE_THRESHOLD", "0.9"))
+
+# Quasi-doublons (MinHash/LSH) : similarité de Jaccard minimale pour réutiliser une extraction précédente
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+# Au-delà de cette part du CV modifiée, extraction complète plutôt que des seules sections changées
+NEAR_DUPLICATE_MAX_CHANGED = float(os.getenv("NEAR_DUPLICATE_MAX_CHANGED", "0.3"))
+# Nombre maximal de CV gardés dans l'index des quasi-doublons (les moins récemment vus sont évincés)
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "10000"))
+
+# Cache des extractions LLM : fichier SQLite optionnel (contient les données personnelles des CV, None = mémoire uniquement)
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH")
+EXTRACTION_CACHE_MEMORY_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MEMORY_ENTRIES", "256"))
+EXTRACTION_CACHE_DISK_ENTRIES = int(os.getenv("EXTRACTION_CACHE_DISK_ENTRIES", "10000"))
+
+# Modèle d'embedding des segments de CV
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+
+# Nombre maximal d'embeddings de segments gardés en mémoire
+EMBEDDING_CACHE_ENTRIES = int(os.getenv("EMBEDDING_CACHE_ENTRIES", "20000"))
+
+# Limites d'extraction PDF (fichiers pathologiques) et parallélisme par page
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "50"))
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", "60"))
+PDF_PAGE_WORKERS = int(os.getenv("PDF_PAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Requêtes de pertinence par groupe de champs du schéma, pour sélectionner les extraits des CV longs
+FIELD_GROUP_QUERIES = {
+    "identite": "nom prénom email téléphone adresse date de naissance âge nationalité",
+    "formation": "formation diplômes études université école ingénieur master licence baccalauréat",
+    "experience": "expériences professionnelles stages entreprise poste missions dates",
+    "competences": "compétences techniques logiciels langues soft skills profil",
+}
+
 # Secteurs similaires à JESA
 SIMILAR_SECTORS = ["Acids", "Buildings", "Energy", "Fertilizer & Chemical", "Ports", "Transport", "Water", "Mining"]
 
@@ -34,15 +101,14 @@ EXPERIENCE_GLOBALE = [
 ]
 
 CV_PROMPT_TEMPLATE = """
-Contexte récupéré : {retrieved_context}
-Texte du CV :
+Texte du CV (intégral, ou extraits les plus pertinents si le CV est long) :
 ---
 {cv_text}
 ---
 
 Extraire les informations suivantes sous forme de JSON strictement structuré. Si une information n'est pas trouvée, utilisez "null" ou une liste vide pour les champs complexes. Le format doit être exact :
 
-{
+{{
   "nom": "Nom de famille (string|null)",
   "prenom": "Prénom (string|null)",
   "email": "Adresse email principale (string|null)",
@@ -53,13 +119,13 @@ Extraire les informations suivantes sous forme de JSON strictement structuré. S
   "nationalite": "Nationalité (string|null) uniquement si explicitement mentionnée",
   "grade": "Grade ('administrative assistant', 'Constructability Engineer', etc.) basé sur expérience. Sinon ''",
   "discipline": "Domaine principal des études (string|null, ex. 'BigData')",
-  "diplomes": [{"nom_diplome": "string|null", "etablissement": "string|null", "annee_obtention": "string|null", "statut": "string|null"}],
-  "stages": [{"entreprise": "string|null", "poste": "string|null", "duree": "string|null", "emplacement": "string|null", "description": "string|null"}],
-  "experiences_professionnelles": [{"entreprise": "string|null", "poste": "string|null", "date_debut": "string|null", "date_fin": "string|null", "emplacement": "string|null", "description": "string|null"}],
+  "diplomes": [{{"nom_diplome": "string|null", "etablissement": "string|null", "annee_obtention": "string|null", "statut": "string|null"}}],
+  "stages": [{{"entreprise": "string|null", "poste": "string|null", "duree": "string|null", "emplacement": "string|null", "description": "string|null"}}],
+  "experiences_professionnelles": [{{"entreprise": "string|null", "poste": "string|null", "date_debut": "string|null", "date_fin": "string|null", "emplacement": "string|null", "description": "string|null"}}],
   "competences_cles": ["string|null"],
   "soft_skills": ["string|null"],
   "profil": "string|null"
-}
+}}
 
 Retourne UNIQUEMENT le JSON, sans texte supplémentaire.
 """
\ No newline at end of file
@@ -1,30 +1,177 @@
 import pdfplumber
 import logging
 import io
+import multiprocessing
+import queue
 import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Iterator, List, Tuple
+import metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def read_pdf(file_content: bytes) -> str:
-    text = ""
-    try:
-        with io.BytesIO(file_content) as pdf_file:
-            with pdfplumber.open(pdf_file) as pdf:
+CID_PATTERN = re.compile(r'\(cid:\d+\)')
+
+# En dessous de ce nombre de pages, le coût de répartition dépasse le gain
+PARALLEL_MIN_PAGES = 8
+# Écart vertical entre deux lignes, en hauteur de ligne, au-delà duquel commence un nouveau paragraphe
+PARAGRAPH_GAP_RATIO = 0.8
+
+_page_pool = None
+_page_pool_workers = 0
+
+def _clean_page(text: str) -> str:
+    return CID_PATTERN.sub('', text) if text else ""
+
+def _page_text(page) -> str:
+    """Text of a page, with a blank line between paragraphs.
+
+    ``extract_text`` joins lines with single newlines, losing the paragraph
+    breaks that ``split_segments`` splits on; they are recovered from the
+    vertical gap between consecutive lines.
+    """
+    lines, previous = [], None
+    for line in page.extract_text_lines(return_chars=False):
+        if previous is not None and line["top"] - previous["bottom"] > PARAGRAPH_GAP_RATIO * (previous["bottom"] - previous["top"]):
+            lines.append("")
+        lines.append(line["text"])
+        previous = line
+    return _clean_page("\n".join(lines))
+
+def _extract_page_range(file_content: bytes, start: int, stop: int) -> List[str]:
+    with pdfplumber.open(io.BytesIO(file_content), pages=list(range(start + 1, stop + 1))) as pdf:
+        texts = []
+        for page in pdf.pages:
+            texts.append(_page_text(page))
+            page.close()
+        return texts
+
+def _get_page_pool(workers: int) -> ProcessPoolExecutor:
+    global _page_pool, _page_pool_workers
+    if _page_pool is None or _page_pool_workers != workers:
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=False, cancel_futures=True)
+        _page_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _page_pool_workers = workers
+    return _page_pool
+
+def _recycle_page_pool(pool: ProcessPoolExecutor):
+    """Drop the pool after a timeout rather than reuse workers that may still be stuck on a page."""
+    global _page_pool
+    if pool is _page_pool:
+        _page_pool = None
+    # Pas d'API publique pour arrêter un worker occupé : un worker bloqué ne rendrait jamais la main
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+def _iter_pages_with_deadline(file_content: bytes, page_count: int, deadline: float, timeout: float) -> Iterator[str]:
+    """Serial extraction in a daemon thread, so a page stuck in ``extract_text`` cannot outlast the deadline.
+
+    A stuck page keeps its thread busy until it returns; the thread then stops
+    at the next page.
+    """
+    pages = queue.Queue()
+    stop = threading.Event()
+
+    def extract():
+        try:
+            with pdfplumber.open(io.BytesIO(file_content), pages=list(range(1, page_count + 1))) as pdf:
                 for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-        return text
+                    if stop.is_set():
+                        return
+                    pages.put(_page_text(page))
+                    page.close()
+        except Exception as e:
+            pages.put(e)
+        finally:
+            pages.put(None)
+
+    threading.Thread(target=extract, name="pdf-pages", daemon=True).start()
+    try:
+        while True:
+            try:
+                text = pages.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                logging.warning(f"Délai d'extraction dépassé ({timeout}s), pages restantes ignorées")
+                return
+            if text is None:
+                return
+            if isinstance(text, Exception):
+                raise text
+            if text:
+                yield text
+    finally:
+        stop.set()
+
+def iter_pdf_pages(file_content: bytes, max_pages: int = None, timeout: float = None, workers: int = 1, pages_per_task: int = 4) -> Iterator[str]:
+    """Yield the cleaned text of each non-empty page, in order, as soon as it is extracted.
+
+    Text is extracted once per page. With ``workers > 1``, PDFs of at least
+    ``PARALLEL_MIN_PAGES`` pages are split into page ranges parsed in a process
+    pool. Extraction stops after ``max_pages`` pages or ``timeout`` seconds,
+    even if a page never returns from ``extract_text``: serial extraction then
+    runs in a background thread, and a pool that timed out is recycled (its
+    workers terminated). Closing the iterator early only cancels the page
+    ranges not started yet; running ones finish in their worker.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    with pdfplumber.open(io.BytesIO(file_content)) as pdf:
+        page_count = len(pdf.pages) if max_pages is None else min(max_pages, len(pdf.pages))
+        if max_pages is not None and len(pdf.pages) > max_pages:
+            logging.warning(f"PDF tronqué à {max_pages} pages sur {len(pdf.pages)}")
+        if deadline is None and (workers <= 1 or page_count < PARALLEL_MIN_PAGES):
+            for page in pdf.pages[:page_count]:
+                text = _page_text(page)
+                page.close()
+                if text:
+                    yield text
+            return
+    if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+        yield from _iter_pages_with_deadline(file_content, page_count, deadline, timeout)
+        return
+
+    pool = _get_page_pool(workers)
+    futures = [pool.submit(_extract_page_range, file_content, start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    try:
+        for future in futures:
+            remaining = deadline - time.monotonic() if deadline else None
+            try:
+                texts = future.result(timeout=max(remaining, 0) if remaining is not None else None)
+            except FutureTimeoutError:
+                logging.warning(f"Délai d'extraction dépassé ({timeout}s), pages restantes ignorées")
+                _recycle_page_pool(pool)
+                return
+            for text in texts:
+                if text:
+                    yield text
+    finally:
+        for future in futures:
+            future.cancel()
+
+@metrics.span("pdf_parse")
+def read_pdf(file_content: bytes, max_pages: int = None, timeout: float = None, workers: int = 1) -> str:
+    try:
+        # Ligne vide entre les pages : chaque page clôt ses paragraphes
+        return "".join(page_text + "\n\n" for page_text in iter_pdf_pages(file_content, max_pages, timeout, workers))
     except Exception as e:
         logging.error(f"Erreur lors de la lecture du PDF : {e}")
         return ""
 
+def read_pdf_timed(file_content: bytes, max_pages: int = None, timeout: float = None) -> Tuple[str, float]:
+    """read_pdf plus its duration, for worker processes whose metrics are not shared with the parent."""
+    start = time.perf_counter()
+    text = read_pdf(file_content, max_pages, timeout)
+    return text, time.perf_counter() - start
+
 def extract_text_from_file(uploaded_file) -> str:
     try:
         file_content = uploaded_file.read()
         if uploaded_file.name.lower().endswith('.pdf'):
             raw_text = read_pdf(file_content)
-            raw_text = re.sub(r'\(cid:\d+\)', '', raw_text)
             logging.info(f"Texte extrait du PDF : {raw_text[:500]}...")
             return raw_text
         else:
@@ -1,77 +1,613 @@
+import asyncio
+import contextlib
+import functools
+import hashlib
 import json
 import logging
 import re
-from groq import Groq
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generator, Iterator, List, Optional, Tuple
+import numpy as np
 import config
 import json_repair
 import httpx
-from httpx import Timeout
-from pinecone import Pinecone, ServerlessSpec
-from vector_store import retrieve_relevant_segments, initialize_vector_store
+import metrics
+import resources
+import rule_extractor
+import vector_store
+from llm_cache import make_cache_key
+from json_stream import IncrementalJSONFields
+from near_duplicates import item_sections, merge_extractions
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-groq_client = None
-pc = None
-index = None
-
-try:
-    if not config.GROQ_API_KEY:
-        raise ValueError("GROQ_API_KEY non défini dans les variables d'environnement.")
-    groq_client = Groq(api_key=config.GROQ_API_KEY, timeout=Timeout(30.0))
-    pc = Pinecone(api_key=config.PINECONE_API_KEY)
-    index = initialize_vector_store()
-except NameError:
-    logging.error("Modules manquants. Installez via 'pip install -r requirements.txt'.")
-    raise
-except Exception as e:
-    logging.error(f"Erreur lors de l'initialisation des dépendances : {e}")
-    raise
-
 def clean_json(json_str: str) -> str:
     json_str = re.sub(r'/\*.*?\*/', '', json_str, flags=re.DOTALL)
     json_str = re.sub(r'\s+', ' ', json_str).strip()
     json_str = re.sub(r'(\"[^\"]*\"|null)(\s*\"[^\"]*\":)', r'\1,\2', json_str)
     return json_str
 
-def generate_embedding(text: str, embedding_model) -> list:
-    return embedding_model.encode(text).tolist()
+class SegmentEmbeddingCache:
+    """Bounded LRU of float32 segment embeddings keyed by a hash of the model identity and segment text."""
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._vectors: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str, model_identity: str) -> bytes:
+        return hashlib.sha1(f"{model_identity}\0{text}".encode("utf-8")).digest()
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._vectors.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def __contains__(self, key: bytes) -> bool:
+        with self._lock:
+            return key in self._vectors
+
+    def put(self, key: bytes, vector: np.ndarray):
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+embedding_cache = SegmentEmbeddingCache(config.EMBEDDING_CACHE_ENTRIES)
+
+def _embedding_dimension(embedding_model) -> Optional[int]:
+    dimension = getattr(embedding_model, "get_sentence_embedding_dimension", None)
+    return dimension() if callable(dimension) else getattr(embedding_model, "dim", None)
+
+def _model_identity(embedding_model) -> str:
+    """Model name and output dimension: changing EMBEDDING_MODEL_NAME must not serve cached vectors of the previous model."""
+    return f"{type(embedding_model).__name__}:{config.EMBEDDING_MODEL_NAME}:{_embedding_dimension(embedding_model)}"
+
+def generate_embedding(text: str, embedding_model) -> np.ndarray:
+    return generate_embeddings([text], embedding_model)[0]
+
+def generate_embeddings(texts: List[str], embedding_model, batch_size: int = 32) -> np.ndarray:
+    """Encode texts as a float32 matrix, in one batched call for the texts not cached yet."""
+    model_identity = _model_identity(embedding_model)
+    keys = [embedding_cache.key(text, model_identity) for text in texts]
+    vectors = [embedding_cache.get(key) for key in keys]
+    missing = {}
+    for key, text, vector in zip(keys, texts, vectors):
+        if vector is None and key not in missing:
+            missing[key] = text
+    metrics.increment("embedding_cache_hits", len(keys) - len(missing))
+    if missing:
+        metrics.increment("segments_encoded", len(missing))
+        with metrics.span("embedding"):
+            encoded = np.asarray(embedding_model.encode(list(missing.values()), batch_size=batch_size), dtype=np.float32)
+        fresh = dict(zip(missing, encoded))
+        for key, vector in fresh.items():
+            embedding_cache.put(key, vector)
+        vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack(vectors)
+
+def split_segments(cv_text: str) -> List[Tuple[int, str]]:
+    return list(_segment(cv_text, config.PROMPT_SEGMENT_MAX_TOKENS)[0])
+
+def index_cv_segments(file_name: str, cv_text: str, embedding_model, namespace: str = ""):
+    index_cv_batch([(file_name, cv_text)], embedding_model, namespace=namespace)
+
+def index_cv_batch(documents: List[Tuple[str, str]], embedding_model, batch_size: int = 32, namespace: str = ""):
+    """Index the segments of several CVs with a single batched encode call.
+
+    Re-indexing a file name replaces all of its previous segments. The index
+    serves search_candidates and the embedding reuse of near-duplicates; the
+    extraction prompt is built from the CV text, not from the index.
+    """
+    index = resources.get_vector_index()
+    for _, cv_text in documents:
+        _reuse_near_duplicate_embeddings(cv_text, embedding_model)
+    for file_name, _ in documents:
+        index.delete(file_name=file_name, namespace=namespace)
+    pending = [(file_name, i, seg) for file_name, cv_text in documents for i, seg in split_segments(cv_text)]
+    if not pending:
+        return
+    embeddings = generate_embeddings([seg for _, _, seg in pending], embedding_model, batch_size)
+    index.upsert([(f"{file_name}_{i}", embedding, {"file_name": file_name, "segment": i, "segment_text": seg}) for (file_name, i, seg), embedding in zip(pending, embeddings)], namespace=namespace)
+    for file_name, cv_text in documents:
+        _register_document(cv_text, file_name=file_name, namespace=namespace)
+
+def _section_hash(section: str) -> str:
+    return hashlib.sha1(re.sub(r'\s+', ' ', section).strip().lower().encode("utf-8")).hexdigest()[:16]
+
+def _register_document(cv_text: str, extraction: dict = None, **payload):
+    """Record the CV's MinHash signature and section hashes for near-duplicate detection.
+
+    With its ``extraction``, also record the section each list item came from,
+    so that a later partial re-extraction only replaces the items of the
+    sections that changed.
+    """
+    near_duplicate_index = resources.get_near_duplicate_index()
+    signature = near_duplicate_index.signature(cv_text)
+    if signature is not None:
+        sections = [(_section_hash(section), section) for section in _prompt_segments(cv_text, config.PROMPT_SEGMENT_MAX_TOKENS)]
+        if extraction is not None:
+            payload["item_sections"] = item_sections(extraction, sections)
+        near_duplicate_index.add(_cache_key(cv_text), signature, {"sections": [section_hash for section_hash, _ in sections], **payload})
+
+def _near_duplicates(cv_text: str) -> List[Tuple[str, float, dict]]:
+    near_duplicate_index = resources.get_near_duplicate_index()
+    signature = near_duplicate_index.signature(cv_text)
+    if signature is None:
+        return []
+    return near_duplicate_index.near_duplicates(signature, exclude=_cache_key(cv_text))
+
+def _reuse_near_duplicate_embeddings(cv_text: str, embedding_model):
+    """Seed the embedding cache with the stored vectors of a near-duplicate CV's segments."""
+    for _, _, payload in _near_duplicates(cv_text):
+        if "file_name" not in payload:
+            continue
+        segments = resources.get_vector_index().document_segments(payload["file_name"], payload.get("namespace", ""))
+        model_identity = _model_identity(embedding_model)
+        dimension = _embedding_dimension(embedding_model)
+        reused = 0
+        for metadata, vector in segments:
+            # Vecteurs d'un index construit avec un autre modèle : inutilisables
+            if dimension is not None and len(vector) != dimension:
+                break
+            key = embedding_cache.key(metadata.get("segment_text", ""), model_identity)
+            if key not in embedding_cache:
+                embedding_cache.put(key, vector)
+                reused += 1
+        metrics.increment("near_duplicate_embeddings_reused", reused)
+        if segments:
+            return
+
+def _near_duplicate_plan(cv_text: str) -> Optional[Tuple[dict, str, dict, set]]:
+    """Previous extraction of a near-duplicate CV, the text of the sections changed since, the sections its
+    list items came from and the section hashes of the new CV, if worth reusing."""
+    for previous_key, similarity, payload in _near_duplicates(cv_text):
+        previous = resources.get_extraction_cache().get(previous_key)
+        if not isinstance(previous, dict):
+            continue
+        known = set(payload.get("sections", ()))
+        sections = [(_section_hash(section), section) for section in _prompt_segments(cv_text, config.PROMPT_SEGMENT_MAX_TOKENS)]
+        changed = "\n\n".join(section for section_hash, section in sections if section_hash not in known)
+        if count_tokens(changed) > config.NEAR_DUPLICATE_MAX_CHANGED * count_tokens(cv_text):
+            return None
+        logging.info(f"Quasi-doublon détecté (similarité {similarity:.2f}) : extraction précédente réutilisée, "
+                     f"{len(changed)} caractères à ré-extraire")
+        metrics.increment("near_duplicate_hits")
+        return previous, changed, payload.get("item_sections"), {section_hash for section_hash, _ in sections}
+    return None
 
-def index_cv_segments(file_name: str, cv_text: str, embedding_model):
-    segments = re.split(r'\n\s*\n', cv_text)
-    vectors = [(f"{file_name}_{i}", generate_embedding(seg, embedding_model), {"file_name": file_name, "segment": i, "segment_text": seg}) for i, seg in enumerate(segments) if seg.strip()]
-    index.upsert(vectors)
+def _is_extraction(result) -> bool:
+    return isinstance(result, dict) and "Erreur" not in result
 
-def retrieve_context(query: str) -> str:
-    return retrieve_relevant_segments(query, index)
+def _merge_near_duplicate(plan: tuple, delta: dict, full_extraction: Callable[[], dict]) -> dict:
+    if not _is_extraction(delta):
+        logging.warning("Ré-extraction partielle en échec, extraction complète du CV")
+        return full_extraction()
+    previous, _, sources, sections = plan
+    return merge_extractions(previous, delta, sources, sections)
 
-def extract_info_with_groq(cv_text: str, query: str, embedding_model) -> dict:
+def tag_document(file_name: str, extracted_info: dict, namespace: str = ""):
+    """Store the extracted fields used as search filters (discipline, grade...) on the indexed CV."""
+    if not isinstance(extracted_info, dict):
+        return
+    fields = {field: extracted_info[field] for field in config.DOCUMENT_FILTER_FIELDS if extracted_info.get(field)}
+    if fields:
+        resources.get_vector_index().set_document_fields(file_name, fields, namespace)
+
+def search_candidates(job_description: str, embedding_model, top_n: int = 10, filters: dict = None, namespace: str = None) -> List[dict]:
+    """Best matching indexed CVs for a job description, e.g. filters={"discipline": "BigData"}."""
+    return vector_store.search_candidates(job_description, resources.get_vector_index(), embedding_model, top_n, config.ANN_NPROBE, namespace, filters)
+
+def save_index():
+    """Persist the rows indexed since the last save, and the near-duplicate signatures, if a vector store path is configured."""
+    index = resources.get_vector_index()
+    if index.path:
+        index.save()
+        resources.get_near_duplicate_index().save(index.path)
+        logging.info(f"Index vectoriel sauvegardé dans {index.path} ({len(index)} segments)")
+
+def _cache_key(cv_text: str) -> str:
+    # Le budget change le prompt envoyé pour les CV longs, donc l'extraction obtenue
+    # Idem pour les champs pré-remplis par les règles
+    return make_cache_key(cv_text, f"{config.CV_PROMPT_TEMPLATE}|{config.PROMPT_INPUT_TOKEN_BUDGET}|rules{rule_extractor.RULES_VERSION}:{config.RULE_CONFIDENCE_THRESHOLD}", config.GROQ_MODEL)
+
+def _cached_extraction(cv_text: str, extract: Callable[[], dict]) -> dict:
+    key = _cache_key(cv_text)
+    cached = resources.get_extraction_cache().get(key)
+    if cached is not None:
+        logging.info("Extraction servie depuis le cache")
+        metrics.increment("extraction_cache_hits")
+        return cached
+    metrics.increment("extraction_cache_misses")
+    result = extract()
+    if _is_extraction(result):
+        _remember_extraction(key, cv_text, result)
+    return result
+
+def _remember_extraction(key: str, cv_text: str, result: dict):
+    resources.get_extraction_cache().put(key, result)
+    _register_document(cv_text, result)
+
+def extract_info_from_index(cv_text: str, query: str, embedding_model) -> dict:
+    """Run the Groq extraction for a CV whose segments are already indexed."""
+    return _cached_extraction(cv_text, lambda: _query_groq(cv_text, query, embedding_model))
+
+_tokenizer = None
+
+def _load_tokenizer():
+    """tiktoken when installed, else the embedding model's own tokenizer, else None."""
     try:
-        index_cv_segments("temp_cv", cv_text, embedding_model)
-        retrieved_context = retrieve_context(query)
-        # Assure-toi que retrieved_context et cv_text sont bien des chaînes
-        print(f"Retrieved Context: {retrieved_context}")
-        print(f"CV Text: {cv_text}")
-        prompt = config.CV_PROMPT_TEMPLATE.format(
-            retrieved_context=str(retrieved_context),
-            cv_text=str(cv_text)
-        )
-        print(f"Prompt envoyé à Groq : {prompt}")
-        response = groq_client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500
-        )
-        # Tente de réparer le JSON avant parsing
-        repaired_json = json_repair.loads(response.choices[0].message.content)
-        return repaired_json
-    except json.JSONDecodeError as e:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base").encode
+    except ImportError:
+        pass
+    try:
+        tokenizer = resources.get_embedding_model().tokenizer
+        return lambda text: tokenizer.encode(text, add_special_tokens=False, verbose=False)
+    except Exception:
+        logging.warning("Aucun tokenizer disponible (tiktoken ni modèle d'embedding) : estimation à ~4 caractères par token, qui sous-estime le français")
+        return None
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken or the embedding tokenizer, else ~4 characters per token."""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = _load_tokenizer() or False
+    if _tokenizer:
+        return len(_tokenizer(text))
+    return (len(text) + 3) // 4
+
+def _prompt_segments(cv_text: str, max_tokens: int) -> List[str]:
+    """Paragraphs of the CV, long ones cut on line boundaries, exact repeats (headers, footers) dropped."""
+    return list(_segment(cv_text, max_tokens)[1])
+
+@functools.lru_cache(maxsize=64)
+def _segment(cv_text: str, max_tokens: int) -> Tuple[Tuple[Tuple[int, str], ...], Tuple[str, ...]]:
+    """Indexed paragraphs and prompt segments of a CV.
+
+    Indexing, prompt building and near-duplicate detection all segment the
+    same CV: it is done, and timed as ``segmentation``, once per text.
+    """
+    with metrics.span("segmentation"):
+        paragraphs = tuple((i, seg) for i, seg in enumerate(re.split(r'\n\s*\n', cv_text)) if seg.strip())
+        max_chars = max_tokens * 4
+        segments = []
+        for _, paragraph in paragraphs:
+            chunk, chunk_tokens = [], 0
+            for line in paragraph.splitlines():
+                for start in range(0, max(len(line), 1), max_chars):
+                    piece = line[start:start + max_chars]
+                    piece_tokens = count_tokens(piece) + 1
+                    if chunk and chunk_tokens + piece_tokens > max_tokens:
+                        segments.append("\n".join(chunk))
+                        chunk, chunk_tokens = [], 0
+                    chunk.append(piece)
+                    chunk_tokens += piece_tokens
+            if chunk:
+                segments.append("\n".join(chunk))
+        seen = set()
+        unique = []
+        for segment in segments:
+            key = re.sub(r'\s+', ' ', segment).strip().lower()
+            if key and key not in seen:
+                seen.add(key)
+                unique.append(segment)
+    return paragraphs, tuple(unique)
+
+def _select_segments(segments: List[str], queries: List[str], embedding_model, budget: int) -> List[str]:
+    """Round-robin over field groups, taking each group's next most relevant segment that still fits."""
+    segment_vectors = generate_embeddings(segments, embedding_model)
+    query_vectors = generate_embeddings(queries, embedding_model)
+    with metrics.span("retrieval"):
+        segment_vectors = segment_vectors / np.maximum(np.linalg.norm(segment_vectors, axis=1, keepdims=True), 1e-12)
+        query_vectors = query_vectors / np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+        rankings = np.argsort(-(query_vectors @ segment_vectors.T), axis=1)
+    costs = [count_tokens(segment) + 1 for segment in segments]
+    chosen = set()
+    remaining = budget
+    for rank in range(len(segments)):
+        for ranking in rankings:
+            i = int(ranking[rank])
+            if i not in chosen and costs[i] <= remaining:
+                chosen.add(i)
+                remaining -= costs[i]
+    # Ordre du document conservé pour que le LLM lise un CV cohérent
+    return [segments[i] for i in sorted(chosen)]
+
+@functools.lru_cache(maxsize=16)
+def _prompt_template(skip_fields: Tuple[str, ...] = ()) -> str:
+    """CV_PROMPT_TEMPLATE without the schema lines of ``skip_fields``."""
+    if not skip_fields:
+        return config.CV_PROMPT_TEMPLATE
+    lines = [line for line in config.CV_PROMPT_TEMPLATE.split("\n") if not any(line.lstrip().startswith(f'"{field}":') for field in skip_fields)]
+    for i in range(len(lines) - 1):
+        if lines[i + 1].strip() == "}}":
+            lines[i] = lines[i].rstrip().rstrip(",")
+    return "\n".join(lines)
+
+def _prefill(cv_text: str) -> dict:
+    """Fields confidently extracted by the rules, which the LLM is not asked for."""
+    return rule_extractor.confident_fields(rule_extractor.extract_rule_fields(cv_text), config.RULE_CONFIDENCE_THRESHOLD)
+
+def _with_rule_fields(extracted_info, prefilled: dict):
+    if isinstance(extracted_info, dict) and "Erreur" not in extracted_info:
+        extracted_info.update(prefilled)
+    return extracted_info
+
+def build_prompt(cv_text: str, embedding_model, query: str = None, budget: int = None, skip_fields: Tuple[str, ...] = ()) -> str:
+    """Fit the extraction prompt into an input token budget.
+
+    The whole CV is sent when it fits; otherwise the segments most relevant to
+    each schema field group (plus ``query``) are selected until the budget is
+    spent. Repeated segments are sent only once. ``skip_fields`` are left out
+    of the requested JSON schema.
+    """
+    budget = budget or config.PROMPT_INPUT_TOKEN_BUDGET
+    template = _prompt_template(tuple(sorted(skip_fields)))
+    available = budget - count_tokens(template.format(cv_text=""))
+    segments = _prompt_segments(cv_text, config.PROMPT_SEGMENT_MAX_TOKENS)
+    content = "\n\n".join(segments)
+    if count_tokens(content) > available:
+        queries = list(config.FIELD_GROUP_QUERIES.values()) + ([query] if query else [])
+        selected = _select_segments(segments, queries, embedding_model, available)
+        logging.info(f"CV long : {len(selected)}/{len(segments)} segments retenus pour un budget de {budget} tokens")
+        content = "\n\n".join(selected)
+    return template.format(cv_text=content)
+
+def _build_prompt(cv_text: str, query: str, embedding_model, skip_fields: Tuple[str, ...] = ()) -> str:
+    prompt = build_prompt(cv_text, embedding_model, query, skip_fields=skip_fields)
+    # Le prompt contient le CV (données personnelles) : journalisé seulement sur échantillon
+    if metrics.sampled(config.DEBUG_PAYLOAD_SAMPLE_RATE):
+        logging.info(f"Prompt envoyé à Groq ({count_tokens(prompt)} tokens) : {prompt}")
+    return prompt
+
+def _parse_content(content: str) -> dict:
+    with metrics.span("json_repair"):
+        return json_repair.loads(content)
+
+def _is_timeout(e: Exception) -> bool:
+    # groq n'est importé qu'à la création du client ; inutile de le charger ici
+    groq = sys.modules.get("groq")
+    return isinstance(e, httpx.TimeoutException) or (groq is not None and isinstance(e, groq.APITimeoutError))
+
+def _extraction_error(e: Exception, content: Optional[str]) -> dict:
+    metrics.increment("extraction_errors")
+    if isinstance(e, json.JSONDecodeError):
         logging.error(f"Erreur lors du parsing JSON : {e}")
-        repaired_json = json_repair.loads(response.choices[0].message.content) if response.choices[0].message.content else {}
+        repaired_json = json_repair.loads(content) if content else {}
         return {"Erreur": str(e), "Repaired": repaired_json}
-    except httpx.TimeoutException as e:
+    if _is_timeout(e):
         logging.error(f"Timeout lors de la requête à Groq : {e}")
         return {"Erreur": "Requête à Groq a expiré"}
+    logging.error(f"Erreur inattendue : {e}")
+    return {"Erreur": str(e)}
+
+def _query_groq(cv_text: str, query: str, embedding_model) -> dict:
+    """Extraction of the CV, or only of its changed sections when a near-duplicate was already extracted."""
+    return _query_groq_with_plan(cv_text, query, embedding_model, _near_duplicate_plan(cv_text))
+
+def _query_groq_with_plan(cv_text: str, query: str, embedding_model, plan: Optional[tuple]) -> dict:
+    if plan is None:
+        return _call_groq(cv_text, query, embedding_model)
+    changed = plan[1]
+    # Sans section modifiée, la fusion retire encore les éléments des sections supprimées
+    delta = _call_groq(changed, query, embedding_model) if changed else {}
+    return _merge_near_duplicate(plan, delta, lambda: _call_groq(cv_text, query, embedding_model))
+
+def _call_groq(cv_text: str, query: str, embedding_model) -> dict:
+    content = None
+    try:
+        prefilled = _prefill(cv_text)
+        prompt = _build_prompt(cv_text, query, embedding_model, tuple(prefilled))
+        metrics.increment("llm_requests")
+        with metrics.span("llm_call"):
+            response = resources.get_groq_client().chat.completions.create(
+                model=config.GROQ_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=config.GROQ_MAX_TOKENS
+            )
+        content = response.choices[0].message.content
+        # Tente de réparer le JSON avant parsing
+        repaired_json = _parse_content(content)
+        return _with_rule_fields(repaired_json, prefilled)
     except Exception as e:
-        logging.error(f"Erreur inattendue : {e}")
-        return {"Erreur": str(e)}
\ No newline at end of file
+        return _extraction_error(e, content)
+
+def extract_info_with_groq(cv_text: str, query: str, embedding_model, file_name: str = "temp_cv", namespace: str = "") -> dict:
+    # Indexé et étiqueté même si l'extraction vient du cache : seul l'appel LLM est évité
+    try:
+        index_cv_segments(file_name, cv_text, embedding_model, namespace)
+    except Exception as e:
+        logging.error(f"Erreur lors de l'indexation du CV : {e}")
+        return {"Erreur": str(e)}
+    extracted_info = _cached_extraction(cv_text, lambda: _query_groq(cv_text, query, embedding_model))
+    if _is_extraction(extracted_info):
+        tag_document(file_name, extracted_info, namespace)
+    return extracted_info
+
+def _stream_deltas(prompt: str) -> Iterator[str]:
+    """Content deltas of a streamed Groq completion.
+
+    ``llm_call`` times the request and the chunk reads only: time spent by the
+    consumer between chunks is not counted, and closing early is not an error.
+    """
+    elapsed, stream = 0.0, None
+    start = time.perf_counter()
+    try:
+        stream = resources.get_groq_client().chat.completions.create(
+            model=config.GROQ_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=config.GROQ_MAX_TOKENS,
+            stream=True
+        )
+        chunks = iter(stream)
+        while True:
+            chunk = next(chunks, None)
+            elapsed += time.perf_counter() - start
+            if chunk is None:
+                return
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+            start = time.perf_counter()
+    except Exception:
+        elapsed += time.perf_counter() - start
+        metrics.increment("llm_call_errors")
+        raise
+    finally:
+        metrics.observe("llm_call", elapsed)
+        if hasattr(stream, "close"):
+            # Abandon en cours de route : libère la connexion HTTP
+            stream.close()
+
+class ExtractionStream:
+    """Iterate to receive ``(field, value)`` pairs as soon as each field is complete.
+
+    Once iteration ends, ``result`` holds the full extraction, identical to what
+    ``extract_info_with_groq`` returns for the same CV (error dicts included).
+    """
+
+    def __init__(self, events: Generator[Tuple[str, Any], None, dict]):
+        self._events = events
+        self.result: Optional[dict] = None
+
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        self.result = yield from self._events
+
+def _stream_groq(cv_text: str, query: str, embedding_model, file_name: str, namespace: str) -> Generator[Tuple[str, Any], None, dict]:
+    try:
+        index_cv_segments(file_name, cv_text, embedding_model, namespace)
+    except Exception as e:
+        logging.error(f"Erreur lors de l'indexation du CV : {e}")
+        return {"Erreur": str(e)}
+    key = _cache_key(cv_text)
+    cached = resources.get_extraction_cache().get(key)
+    if cached is not None:
+        logging.info("Extraction servie depuis le cache")
+        metrics.increment("extraction_cache_hits")
+        if isinstance(cached, dict):
+            tag_document(file_name, cached, namespace)
+            yield from cached.items()
+        return cached
+    metrics.increment("extraction_cache_misses")
+    parser = IncrementalJSONFields()
+    try:
+        plan = _near_duplicate_plan(cv_text)
+        if plan is not None:
+            # Quasi-doublon : au plus une courte ré-extraction, rien à streamer
+            extracted_info = _query_groq_with_plan(cv_text, query, embedding_model, plan)
+            if _is_extraction(extracted_info):
+                yield from extracted_info.items()
+                _remember_extraction(key, cv_text, extracted_info)
+                tag_document(file_name, extracted_info, namespace)
+            return extracted_info
+        prefilled = _prefill(cv_text)
+        # Champs déjà connus : affichés avant même la réponse de Groq
+        yield from prefilled.items()
+        prompt = _build_prompt(cv_text, query, embedding_model, tuple(prefilled))
+        metrics.increment("llm_requests")
+        start = time.perf_counter()
+        first_field = True
+        with contextlib.closing(_stream_deltas(prompt)) as deltas:
+            for delta in deltas:
+                for field in parser.feed(delta):
+                    if field[0] in prefilled:
+                        continue
+                    if first_field:
+                        metrics.observe("llm_first_field", time.perf_counter() - start)
+                        first_field = False
+                    yield field
+        # Même réparation que le mode non streamé : le résultat final fait foi
+        extracted_info = _with_rule_fields(_parse_content(parser.text), prefilled)
+    except Exception as e:
+        return _extraction_error(e, parser.text or None)
+    if _is_extraction(extracted_info):
+        _remember_extraction(key, cv_text, extracted_info)
+        tag_document(file_name, extracted_info, namespace)
+    return extracted_info
+
+def extract_info_with_groq_stream(cv_text: str, query: str, embedding_model, file_name: str = "temp_cv", namespace: str = "") -> ExtractionStream:
+    """Streaming variant of extract_info_with_groq, for rendering fields progressively."""
+    return ExtractionStream(_stream_groq(cv_text, query, embedding_model, file_name, namespace))
+
+async def _query_groq_async(cv_text: str, query: str, embedding_model) -> dict:
+    plan = _near_duplicate_plan(cv_text)
+    if plan is None:
+        return await _call_groq_async(cv_text, query, embedding_model)
+    changed = plan[1]
+    delta = await _call_groq_async(changed, query, embedding_model) if changed else {}
+    if not _is_extraction(delta):
+        logging.warning("Ré-extraction partielle en échec, extraction complète du CV")
+        return await _call_groq_async(cv_text, query, embedding_model)
+    previous, _, sources, sections = plan
+    return merge_extractions(previous, delta, sources, sections)
+
+async def _call_groq_async(cv_text: str, query: str, embedding_model) -> dict:
+    content = None
+    try:
+        # L'embedding de la requête est CPU-bound : on le sort de la boucle d'événements
+        prefilled = _prefill(cv_text)
+        prompt = await asyncio.to_thread(_build_prompt, cv_text, query, embedding_model, tuple(prefilled))
+        estimated_tokens = count_tokens(prompt) + config.GROQ_MAX_TOKENS
+        async_groq_client = resources.get_async_groq_client()
+
+        async def call():
+            # Mesuré par tentative : l'attente du quota n'est pas comptée dans llm_call
+            metrics.increment("llm_requests")
+            with metrics.span("llm_call"):
+                return await async_groq_client.chat.completions.create(
+                    model=config.GROQ_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=config.GROQ_MAX_TOKENS
+                )
+        response = await resources.get_groq_rate_limiter().run(call, estimated_tokens)
+        content = response.choices[0].message.content
+        return _with_rule_fields(_parse_content(content), prefilled)
+    except Exception as e:
+        return _extraction_error(e, content)
+
+async def _cached_extraction_async(cv_text: str, extract: Callable[[], Awaitable[dict]]) -> dict:
+    key = _cache_key(cv_text)
+    cached = resources.get_extraction_cache().get(key)
+    if cached is not None:
+        logging.info("Extraction servie depuis le cache")
+        metrics.increment("extraction_cache_hits")
+        return cached
+    metrics.increment("extraction_cache_misses")
+    result = await extract()
+    if _is_extraction(result):
+        _remember_extraction(key, cv_text, result)
+    return result
+
+async def extract_info_from_index_async(cv_text: str, query: str, embedding_model) -> dict:
+    """Async counterpart of extract_info_from_index, scheduled under the Groq quota."""
+    return await _cached_extraction_async(cv_text, lambda: _query_groq_async(cv_text, query, embedding_model))
+
+async def extract_info_with_groq_async(cv_text: str, query: str, embedding_model, file_name: str = "temp_cv", namespace: str = "") -> dict:
+    try:
+        await asyncio.to_thread(index_cv_segments, file_name, cv_text, embedding_model, namespace)
+    except Exception as e:
+        logging.error(f"Erreur lors de l'indexation du CV : {e}")
+        return {"Erreur": str(e)}
+    extracted_info = await _cached_extraction_async(cv_text, lambda: _query_groq_async(cv_text, query, embedding_model))
+    if _is_extraction(extracted_info):
+        tag_document(file_name, extracted_info, namespace)
+    return extracted_info
+
+async def extract_many_async(cv_texts: List[str], query: str, embedding_model) -> List[dict]:
+    """Extract several already-indexed CVs concurrently; the rate limiter bounds in-flight calls."""
+    return await asyncio.gather(*(extract_info_from_index_async(cv_text, query, embedding_model) for cv_text in cv_texts))
\ No newline at end of file
@@ -1,7 +1,9 @@
+import heapq
 import logging
 import re
-from typing import Dict, Any, List
+from typing import Dict, Any, FrozenSet, Iterable, List, Tuple, Union
 from datetime import datetime
+import metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -54,10 +56,10 @@ def calculate_experience_duration(experiences: List[Dict[str, Any]]) -> int:
         duration = end_year - start_year
         if duration > 0:
             total_years += duration
-            logging.info(f"Expérience {exp.get('poste', 'inconnue')} : {duration} ans")
+            logging.debug(f"Expérience {exp.get('poste', 'inconnue')} : {duration} ans")
         else:
             logging.warning(f"Durée négative ou nulle pour l'expérience {exp}")
-    logging.info(f"Durée totale calculée : {total_years} ans")
+    logging.debug(f"Durée totale calculée : {total_years} ans")
     return total_years
 
 def partial_match(text1: str, text2: str) -> float:
@@ -69,8 +71,124 @@ def partial_match(text1: str, text2: str) -> float:
     total_unique_words = len(words1.union(words2))
     return len(common_words) / total_unique_words if total_unique_words > 0 else 0.0
 
-def structure_candidate_data(groq_data: Dict[str, Any], criteria: Dict[str, Any], file_name: str) -> Dict[str, Any]:
+EXPERIENCE_MAP = {"inférieur à 2 ans": (0, 2), "entre 2 et 6 ans": (2, 6), "entre 6 et 10 ans": (6, 10), "entre 10 et 15 ans": (10, 15), "+15 ans": (15, float('inf'))}
+DIPLOMA_MAPPING = {"licence professionnelle en génie électrique et énergies renouvelables": "bac+3", "diplôme de technicien en électricité de maintenance industrielle": "bac+2", "diplôme de spécialisation en électricité de bâtiment": "bac+2", "baccalauréat en sciences physiques et chimiques": "bac"}
+DIPLOMA_LEVELS = {"bac": 0, "bac+1": 1, "bac+2": 2, "bac+3": 3, "licence": 3, "bac+4": 4, "bac+5": 5, "master": 5, "doctorat": 8}
+DISCIPLINE_MAPPING = {"génie électrique et énergies renouvelables": "electrical"}
+SECTOR_KEYWORDS = {"energy": ["électrique", "énergie", "renewable", "électricité"], "construction": ["chantier", "construction"], "it": ["informatique", "data"], "manufacturing": ["industriel", "maintenance"]}
+
+def _word_set(text: str) -> FrozenSet[str]:
+    return frozenset(text.lower().split()) if text else frozenset()
+
+def _word_overlap(words1: FrozenSet[str], words2: FrozenSet[str]) -> float:
+    """partial_match on precomputed word sets."""
+    total_unique_words = len(words1 | words2)
+    return len(words1 & words2) / total_unique_words if words1 and words2 and total_unique_words > 0 else 0.0
+
+class CompiledCriteria:
+    """Recruiter criteria preprocessed once into sets, ranges and compiled patterns."""
+
+    __slots__ = ("grade_active", "required_grade_words", "experience_globale_active", "required_experience_range",
+                 "niveau_etudes_active", "required_diploma_level", "discipline_active", "required_discipline_words",
+                 "secteur_experience_active", "sector_pattern", "localisation_active", "required_location",
+                 "competences_active", "required_skills")
+
+    def __init__(self, criteria: Dict[str, Any]):
+        self.grade_active = criteria.get("grade_active", False)
+        self.required_grade_words = _word_set((criteria.get("grade_requirement") or "").lower())
+        self.experience_globale_active = criteria.get("experience_globale_active", False)
+        self.required_experience_range = EXPERIENCE_MAP.get(criteria.get("experience_globale_requirement") or "", (0, 2))
+        self.niveau_etudes_active = criteria.get("niveau_etudes_active", False)
+        self.required_diploma_level = DIPLOMA_LEVELS.get((criteria.get("niveau_etudes_requirement") or "").lower()) or 0
+        self.discipline_active = criteria.get("discipline_active", False)
+        self.required_discipline_words = _word_set((criteria.get("discipline_requirement") or "").lower())
+        self.secteur_experience_active = criteria.get("secteur_experience_active", False)
+        required_sector = (criteria.get("secteur_experience_requirement") or "").lower()
+        self.sector_pattern = re.compile("|".join(re.escape(keyword) for keyword in SECTOR_KEYWORDS.get(required_sector, [required_sector])))
+        self.localisation_active = criteria.get("localisation_active", False)
+        self.required_location = (criteria.get("localisation_requirement") or "").lower()
+        self.competences_active = criteria.get("competences_active", False)
+        self.required_skills = frozenset(skill.strip().lower() for skill in (criteria.get("competences_requirement") or "").split(","))
+
+def compile_criteria(criteria: Union[Dict[str, Any], CompiledCriteria]) -> CompiledCriteria:
+    return criteria if isinstance(criteria, CompiledCriteria) else CompiledCriteria(criteria)
+
+def score_candidate(groq_data: Dict[str, Any], criteria: Union[Dict[str, Any], CompiledCriteria]) -> Tuple[Dict[str, int], int]:
+    """Return (score details, total score) for one extracted profile."""
+    criteria = compile_criteria(criteria)
+    score_details = {}
+    total_score = 0
+
+    if criteria.grade_active:
+        match_score = _word_overlap(_word_set(groq_data.get("grade", "").lower()), criteria.required_grade_words)
+        score_details["Grade"] = 15 if match_score == 1.0 else int(15 * match_score)
+        total_score += score_details["Grade"]
+
+    if criteria.experience_globale_active:
+        years = calculate_experience_duration(groq_data.get("experiences_professionnelles", []))
+        req_range = criteria.required_experience_range
+        if req_range[0] <= years <= req_range[1]:
+            score_details["Expérience globale"] = 30
+        elif years < req_range[0] and years >= req_range[0] - 2:
+            score_details["Expérience globale"] = 15
+        elif years > req_range[1] and years <= req_range[1] + 2:
+            score_details["Expérience globale"] = 20
+        else:
+            score_details["Expérience globale"] = 0
+        total_score += score_details["Expérience globale"]
+
+    if criteria.niveau_etudes_active:
+        highest_diploma = max((d.get("nom_diplome", "") for d in groq_data.get("diplomes", [])), default="")
+        normalized_diploma = DIPLOMA_MAPPING.get(highest_diploma.lower(), highest_diploma.lower())
+        candidate_level = DIPLOMA_LEVELS.get(normalized_diploma)
+        if candidate_level is None: candidate_level = 0
+        level_difference = candidate_level - criteria.required_diploma_level
+        if level_difference == 0:
+            score_details["Niveau d'études"] = 20
+        elif level_difference > 0:
+            score_details["Niveau d'études"] = 15 if level_difference == 1 else 10 if level_difference == 2 else 5
+        else:
+            level_difference = abs(level_difference)
+            score_details["Niveau d'études"] = 10 if level_difference == 1 else 5 if level_difference == 2 else 0
+        total_score += score_details["Niveau d'études"]
+
+    if criteria.discipline_active:
+        discipline = groq_data.get("discipline", "").lower()
+        normalized_discipline = DISCIPLINE_MAPPING.get(discipline, discipline)
+        match_score = _word_overlap(_word_set(normalized_discipline), criteria.required_discipline_words)
+        score_details["Discipline"] = 15 if match_score == 1.0 else int(15 * match_score)
+        total_score += score_details["Discipline"]
+
+    if criteria.secteur_experience_active:
+        sectors = [exp.get("description", "").lower() for exp in groq_data.get("experiences_professionnelles", [])]
+        sectors.extend([skill.lower() for skill in groq_data.get("competences_cles", [])])
+        sectors.append(groq_data.get("profil", "").lower())
+        match_found = any(criteria.sector_pattern.search(s) for s in sectors)
+        score_details["Secteur d'expérience"] = 20 if match_found else 0
+        total_score += score_details["Secteur d'expérience"]
+
+    return score_details, total_score
+
+def rank_candidates(candidates: Iterable[Tuple[str, Dict[str, Any]]], criteria: Union[Dict[str, Any], CompiledCriteria], top_n: int = 10) -> List[Tuple[str, Dict[str, Any]]]:
+    """Score (file_name, groq_data) pairs in one pass and structure only the top N, best first."""
+    criteria = compile_criteria(criteria)
+
+    def scored():
+        for file_name, groq_data in candidates:
+            if not isinstance(groq_data, dict) or "Erreur" in groq_data:
+                continue
+            try:
+                yield score_candidate(groq_data, criteria)[1], file_name, groq_data
+            except Exception as e:
+                logging.warning(f"Score impossible pour {file_name} : {e}")
+
+    top = heapq.nlargest(top_n, scored(), key=lambda item: item[0])
+    return [(file_name, structure_candidate_data(groq_data, criteria, file_name)) for _, file_name, groq_data in top]
+
+@metrics.span("structure_candidate")
+def structure_candidate_data(groq_data: Dict[str, Any], criteria: Union[Dict[str, Any], CompiledCriteria], file_name: str) -> Dict[str, Any]:
     try:
+        criteria = compile_criteria(criteria)
         if not isinstance(groq_data, dict):
             logging.error(f"Données Groq invalides pour {file_name}: {groq_data}")
             return {"Erreur": "Données Groq invalides"}
@@ -107,75 +225,7 @@ def structure_candidate_data(groq_data: Dict[str, Any], criteria: Dict[str, Any]
                 "Statut": diplome.get("statut", "")
             })
 
-        score_details = {}
-        total_score = 0
-        max_score = 0
-
-        if criteria.get("grade_active", False):
-            candidate_grade = groq_data.get("grade", "").lower()
-            required_grade = criteria.get("grade_requirement", "").lower()
-            match_score = partial_match(candidate_grade, required_grade)
-            score_details["Grade"] = 15 if match_score == 1.0 else int(15 * match_score)
-            total_score += score_details["Grade"]
-            max_score += 15
-
-        if criteria.get("experience_globale_active", False):
-            years = calculate_experience_duration(groq_data.get("experiences_professionnelles", []))
-            experience_map = {"inférieur à 2 ans": (0, 2), "entre 2 et 6 ans": (2, 6), "entre 6 et 10 ans": (6, 10), "entre 10 et 15 ans": (10, 15), "+15 ans": (15, float('inf'))}
-            req_range = experience_map.get(criteria.get("experience_globale_requirement", ""), (0, 2))
-            if req_range[0] <= years <= req_range[1]:
-                score_details["Expérience globale"] = 30
-            elif years < req_range[0] and years >= req_range[0] - 2:
-                score_details["Expérience globale"] = 15
-            elif years > req_range[1] and years <= req_range[1] + 2:
-                score_details["Expérience globale"] = 20
-            else:
-                score_details["Expérience globale"] = 0
-            total_score += score_details["Expérience globale"]
-            max_score += 30
-
-        if criteria.get("niveau_etudes_active", False):
-            highest_diploma = max((d.get("nom_diplome", "") for d in groq_data.get("diplomes", [])), default="")
-            required_diploma = criteria.get("niveau_etudes_requirement", "").lower()
-            diploma_mapping = {"licence professionnelle en génie électrique et énergies renouvelables": "bac+3", "diplôme de technicien en électricité de maintenance industrielle": "bac+2", "diplôme de spécialisation en électricité de bâtiment": "bac+2", "baccalauréat en sciences physiques et chimiques": "bac"}
-            normalized_diploma = diploma_mapping.get(highest_diploma.lower(), highest_diploma.lower())
-            diploma_levels = {"bac": 0, "bac+1": 1, "bac+2": 2, "bac+3": 3, "licence": 3, "bac+4": 4, "bac+5": 5, "master": 5, "doctorat": 8}
-            candidate_level = diploma_levels.get(normalized_diploma)
-            required_level = diploma_levels.get(required_diploma)
-            if candidate_level is None: candidate_level = 0
-            if required_level is None: required_level = 0
-            level_difference = candidate_level - required_level
-            if level_difference == 0:
-                score_details["Niveau d'études"] = 20
-            elif level_difference > 0:
-                score_details["Niveau d'études"] = 15 if level_difference == 1 else 10 if level_difference == 2 else 5
-            else:
-                level_difference = abs(level_difference)
-                score_details["Niveau d'études"] = 10 if level_difference == 1 else 5 if level_difference == 2 else 0
-            total_score += score_details["Niveau d'études"]
-            max_score += 20
-
-        if criteria.get("discipline_active", False):
-            discipline = groq_data.get("discipline", "").lower()
-            required_discipline = criteria.get("discipline_requirement", "").lower()
-            discipline_mapping = {"génie électrique et énergies renouvelables": "electrical"}
-            normalized_discipline = discipline_mapping.get(discipline, discipline)
-            match_score = partial_match(normalized_discipline, required_discipline)
-            score_details["Discipline"] = 15 if match_score == 1.0 else int(15 * match_score)
-            total_score += score_details["Discipline"]
-            max_score += 15
-
-        if criteria.get("secteur_experience_active", False):
-            sectors = [exp.get("description", "").lower() for exp in groq_data.get("experiences_professionnelles", [])]
-            sectors.extend([skill.lower() for skill in groq_data.get("competences_cles", [])])
-            sectors.append(groq_data.get("profil", "").lower())
-            required_sector = criteria.get("secteur_experience_requirement", "").lower()
-            sector_keywords = {"energy": ["électrique", "énergie", "renewable", "électricité"], "construction": ["chantier", "construction"], "it": ["informatique", "data"], "manufacturing": ["industriel", "maintenance"]}
-            required_keywords = sector_keywords.get(required_sector, [required_sector])
-            match_found = any(any(keyword in s for keyword in required_keywords) for s in sectors)
-            score_details["Secteur d'expérience"] = 20 if match_found else 0
-            total_score += score_details["Secteur d'expérience"]
-            max_score += 20
+        score_details, total_score = score_candidate(groq_data, criteria)
 
         normalized_score = total_score
         logging.info(f"Score total : {normalized_score}/100")
@@ -183,9 +233,9 @@ def structure_candidate_data(groq_data: Dict[str, Any], criteria: Dict[str, Any]
         badges = []
         remark = ""
 
-        if criteria.get("localisation_active", False):
+        if criteria.localisation_active:
             locations = [(exp.get("emplacement", "") or "").lower() for exp in (groq_data.get("experiences_professionnelles", []) + groq_data.get("stages", []))]
-            required_location = criteria.get("localisation_requirement", "").lower()
+            required_location = criteria.required_location
             matched_locations = [loc for loc in locations if required_location in loc]
             if matched_locations:
                 badges.append({"name": "🌍 Location Match", "description": f"Based in {', '.join(set(matched_locations))}"})
@@ -194,10 +244,9 @@ def structure_candidate_data(groq_data: Dict[str, Any], criteria: Dict[str, Any]
                 badges.append({"name": "🌍 Location Match", "description": "Shows mobility potential"})
                 remark += "Candidate shows mobility potential. "
 
-        if criteria.get("competences_active", False):
+        if criteria.competences_active:
             candidate_skills = [skill.lower() for skill in groq_data.get("competences_cles", [])]
-            required_skills = [skill.strip().lower() for skill in criteria.get("competences_requirement", "").split(",")]
-            matched_skills = [skill for skill in candidate_skills if skill in required_skills]
+            matched_skills = [skill for skill in candidate_skills if skill in criteria.required_skills]
             if matched_skills:
                 badges.append({"name": "🛠️ Skill Fit", "description": f"Skills: {', '.join(matched_skills)}"})
                 remark += f"Skills such as {', '.join(matched_skills)} are present. "
@@ -0,0 +1,92 @@
+import bisect
+import json
+from typing import Any, List, Optional, Tuple
+
+import json_repair
+
+
+class IncrementalJSONFields:
+    """Incremental parser yielding the top-level fields of a streamed JSON object.
+
+    ``feed`` takes the next chunk of text and returns the ``(field, value)``
+    pairs completed by it. Each character is scanned once and chunks are kept
+    as a list, joined only for the keys and values completed; text before the
+    opening brace (e.g. a Markdown fence) is ignored.
+    """
+
+    def __init__(self):
+        self.done = False
+        self._chunks: List[str] = []
+        self._starts: List[int] = []
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        if len(self._chunks) > 1:
+            self._chunks, self._starts = ["".join(self._chunks)], [0]
+        return self._chunks[0] if self._chunks else ""
+
+    def _slice(self, start: int, stop: int) -> str:
+        first = bisect.bisect_right(self._starts, start) - 1
+        last = bisect.bisect_left(self._starts, stop)
+        offset = self._starts[first]
+        return "".join(self._chunks[first:last])[start - offset:stop - offset]
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        if not chunk:
+            return []
+        base = self._pos
+        self._chunks.append(chunk)
+        self._starts.append(base)
+        self._pos += len(chunk)
+        fields = []
+        for pos, ch in enumerate(chunk, base):
+            if self.done:
+                break
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._key = json.loads(self._slice(self._key_start, pos + 1))
+                        self._key_start = None
+            elif self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._key_start = pos
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete(self._slice(self._value_start, pos) if self._value_start is not None else None, fields)
+                    self.done = True
+            elif self._depth == 1:
+                if ch == ":" and self._key is not None and self._value_start is None:
+                    self._value_start = pos + 1
+                elif ch == "," and self._value_start is not None:
+                    self._complete(self._slice(self._value_start, pos), fields)
+        return fields
+
+    def _complete(self, value_text: Optional[str], fields: List[Tuple[str, Any]]):
+        if value_text is not None and value_text.strip():
+            try:
+                value = json.loads(value_text)
+            except json.JSONDecodeError:
+                value = json_repair.loads(value_text)
+            fields.append((self._key, value))
+        self._key = None
+        self._value_start = None
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def normalize_cv_text(cv_text: str) -> str:
+    return re.sub(r'\s+', ' ', cv_text).strip()
+
+
+def make_cache_key(cv_text: str, prompt_template: str, model: str) -> str:
+    """Content-addressed key: normalized CV text, prompt template and model name."""
+    digest = hashlib.sha256()
+    for part in (normalize_cv_text(cv_text), prompt_template, model):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Two-tier cache for LLM extraction results: an in-process LRU backed by SQLite.
+
+    Values are stored as JSON so every ``get`` returns a fresh object that callers
+    may mutate freely. Both tiers are bounded and evict least recently used entries.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_memory_entries: int = 256, max_disk_entries: int = 10000):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS extractions (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_access REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS extractions_last_access ON extractions (last_access)")
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(value)
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM extractions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE extractions SET last_access = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._remember(key, row[0])
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any):
+        serialized = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, serialized)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO extractions (key, value, last_access) VALUES (?, ?, ?)", (key, serialized, time.time()))
+                overflow = self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()[0] - self.max_disk_entries
+                if overflow > 0:
+                    self._db.execute("DELETE FROM extractions WHERE key IN (SELECT key FROM extractions ORDER BY last_access LIMIT ?)", (overflow,))
+                self._db.commit()
+
+    def _remember(self, key: str, serialized: str):
+        self._memory[key] = serialized
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM extractions")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            disk_entries = self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()[0] if self._db is not None else 0
+            return {
+                "hits": self.memory_hits + self.disk_hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
@@ -0,0 +1,144 @@
+"""In-process counters and latency histograms for the CV pipeline.
+
+Stages are timed with ``span("name")`` context managers; the collected data can
+be exported as a Prometheus text file or a JSON snapshot.
+"""
+import bisect
+import contextlib
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PREFIX = "cv_analyser"
+
+# Bornes en secondes, de la regex (ms) à l'appel LLM (dizaines de secondes)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; quantiles are interpolated within buckets."""
+
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / bucket_count)
+            seen += bucket_count
+        return self.max
+
+
+class MetricsRegistry:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[str, float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, stage: str, seconds: float):
+        """Record a duration measured elsewhere (e.g. in a worker process)."""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block as ``stage``; exceptions are counted then re-raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment(f"{stage}_errors")
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "stages": {
+                    stage: {
+                        "count": histogram.count,
+                        "total_s": round(histogram.total, 6),
+                        "mean_ms": round(histogram.total / histogram.count * 1000, 3),
+                        **{f"p{int(q * 100)}_ms": round(histogram.quantile(q) * 1000, 3) for q in (0.5, 0.95, 0.99)},
+                        "max_ms": round(histogram.max * 1000, 3),
+                    }
+                    for stage, histogram in sorted(self._histograms.items()) if histogram.count
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+                lines.append(f"{PREFIX}_{name}_total {value:g}")
+            metric = f"{PREFIX}_stage_duration_seconds"
+            if self._histograms:
+                lines.append(f"# TYPE {metric} histogram")
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.bounds + (float("inf"),), histogram.counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        """Write a Prometheus text file (``.prom``/``.txt``) or a JSON snapshot (any other extension)."""
+        if path.endswith((".prom", ".txt")):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=2)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+registry = MetricsRegistry()
+span = registry.span
+increment = registry.increment
+observe = registry.observe
+
+
+def sampled(rate: float) -> bool:
+    """True for roughly ``rate`` of the calls; used to gate verbose payload logging."""
+    return rate > 0 and random.random() < rate
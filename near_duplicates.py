@@ -0,0 +1,261 @@
+"""MinHash/LSH index of CV texts for near-duplicate detection.
+
+Candidates often re-apply with slightly edited CVs. A MinHash signature of the
+word shingles estimates the Jaccard similarity of two texts; banding the
+signatures (LSH) finds the likely near-duplicates without scanning the corpus.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from llm_cache import normalize_cv_text
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+INDEX_FILE = "near_duplicates.npz"
+PAYLOADS_FILE = "near_duplicates.jsonl"
+
+# Premier de Mersenne : (a * x + b) mod P reste exact en uint64 pour x < 2**32
+_PRIME = (1 << 61) - 1
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Champs de liste dont les éléments sont identifiés par ces clés lors d'une fusion
+LIST_IDENTITY = {
+    "diplomes": ("nom_diplome", "etablissement"),
+    "stages": ("entreprise", "poste"),
+    "experiences_professionnelles": ("entreprise", "poste"),
+}
+# Part minimale des mots d'un élément de liste présents dans une section pour le lui attribuer
+ATTRIBUTION_MIN_OVERLAP = 0.6
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    words = normalize_cv_text(text).lower().split()
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+class NearDuplicateIndex:
+    """MinHash signatures banded into LSH buckets.
+
+    With ``bands`` bands of ``num_perm / bands`` rows, pairs above roughly
+    ``(1 / bands) ** (bands / num_perm)`` Jaccard similarity share a bucket with
+    high probability; candidates are then checked against ``threshold`` using
+    the full signatures. At most ``max_entries`` documents are kept; the least
+    recently added or matched are evicted and their slot reused.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, threshold: float = 0.8, seed: int = 1, max_entries: int = 10000):
+        if num_perm % bands:
+            raise ValueError("num_perm doit être un multiple de bands.")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.threshold = threshold
+        self.max_entries = max_entries
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self.keys: List[Optional[str]] = []
+        self.payloads: List[Optional[Dict[str, Any]]] = []
+        # Clé -> emplacement, du moins au plus récemment utilisé
+        self._positions: "OrderedDict[str, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of the text's word 3-grams (None for an empty text)."""
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in set(shingles(text))), dtype=np.uint64)
+        if not len(hashes):
+            return None
+        return (((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME) & _MAX_HASH).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[int]:
+        rows = self.num_perm // self.bands
+        return [hash(signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, key: str, signature: np.ndarray, payload: Dict[str, Any] = None):
+        """Register a document; adding an existing key only updates its payload."""
+        with self._lock:
+            position = self._positions.get(key)
+            if position is not None:
+                self._positions.move_to_end(key)
+                self.payloads[position].update(payload or {})
+                return
+            while len(self._positions) >= self.max_entries:
+                self._evict_oldest()
+            if self._free:
+                position = self._free.pop()
+                self.keys[position], self.payloads[position] = key, dict(payload or {})
+            else:
+                position = len(self.keys)
+                self.keys.append(key)
+                self.payloads.append(dict(payload or {}))
+            self._positions[key] = position
+            if position == len(self._signatures):
+                grown = np.empty((max(64, 2 * position), self.num_perm), dtype=np.uint32)
+                grown[:position] = self._signatures[:position]
+                self._signatures = grown
+            self._signatures[position] = signature
+            for band, band_key in enumerate(self._band_keys(signature)):
+                self._buckets[band].setdefault(band_key, []).append(position)
+
+    def _evict_oldest(self):
+        _, position = self._positions.popitem(last=False)
+        for band, band_key in enumerate(self._band_keys(self._signatures[position])):
+            bucket = self._buckets[band][band_key]
+            bucket.remove(position)
+            if not bucket:
+                del self._buckets[band][band_key]
+        self.keys[position] = self.payloads[position] = None
+        self._free.append(position)
+
+    def payload(self, key: str) -> Optional[Dict[str, Any]]:
+        position = self._positions.get(key)
+        return None if position is None else self.payloads[position]
+
+    def near_duplicates(self, signature: np.ndarray, exclude: str = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """(key, estimated Jaccard similarity, payload) of the documents above the threshold, most similar first."""
+        with self._lock:
+            candidates = set()
+            for band, band_key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(band_key, ()))
+            if not candidates:
+                return []
+            positions = np.fromiter(candidates, dtype=np.int64)
+            similarities = (self._signatures[positions] == signature).mean(axis=1)
+            matches = [(self.keys[position], float(similarity), self.payloads[position])
+                       for position, similarity in zip(positions, similarities)
+                       if similarity >= self.threshold and self.keys[position] != exclude]
+            for key, _, _ in matches:
+                self._positions.move_to_end(key)
+        return sorted(matches, key=lambda match: -match[1])
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            # Du moins au plus récent : le rechargement conserve l'ordre d'éviction
+            positions = list(self._positions.values())
+            with open(os.path.join(path, PAYLOADS_FILE + ".tmp"), "w", encoding="utf-8") as f:
+                for position in positions:
+                    f.write(json.dumps({"key": self.keys[position], "payload": self.payloads[position]}, ensure_ascii=False) + "\n")
+            with open(os.path.join(path, INDEX_FILE + ".tmp"), "wb") as f:
+                np.savez(f, signatures=self._signatures[positions], a=self._a, b=self._b, bands=self.bands)
+        os.replace(os.path.join(path, PAYLOADS_FILE + ".tmp"), os.path.join(path, PAYLOADS_FILE))
+        os.replace(os.path.join(path, INDEX_FILE + ".tmp"), os.path.join(path, INDEX_FILE))
+
+    @classmethod
+    def load(cls, path: str, threshold: float = 0.8, max_entries: int = 10000) -> "NearDuplicateIndex":
+        with np.load(os.path.join(path, INDEX_FILE)) as data:
+            signatures = data["signatures"]
+            index = cls(num_perm=len(data["a"]), bands=int(data["bands"]), threshold=threshold, max_entries=max_entries)
+            index._a, index._b = data["a"], data["b"]
+        with open(os.path.join(path, PAYLOADS_FILE), encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        for record, signature in zip(records, signatures):
+            index.add(record["key"], signature, record["payload"])
+        return index
+
+
+def open_near_duplicate_index(path: str = None, threshold: float = 0.8, max_entries: int = 10000) -> NearDuplicateIndex:
+    """Load the index saved under ``path``, or start an empty one."""
+    if path and os.path.exists(os.path.join(path, INDEX_FILE)):
+        try:
+            return NearDuplicateIndex.load(path, threshold, max_entries)
+        except Exception as e:
+            logging.warning(f"Index des quasi-doublons illisible, reconstruit à vide : {e}")
+    return NearDuplicateIndex(threshold=threshold, max_entries=max_entries)
+
+
+def _identity(field: str, item: Any):
+    keys = LIST_IDENTITY.get(field)
+    if keys and isinstance(item, dict):
+        return tuple((item.get(key) or "").strip().lower() for key in keys)
+    if isinstance(item, str):
+        return item.strip().lower()
+    return json.dumps(item, sort_keys=True, ensure_ascii=False)
+
+
+def _tokens(text: str) -> set:
+    """Lowercase words of three letters or more, accents removed."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return {word for word in re.findall(r"\w+", "".join(ch for ch in text if not unicodedata.combining(ch))) if len(word) > 2}
+
+
+def _item_text(field: str, item: Any) -> str:
+    if isinstance(item, dict):
+        keys = LIST_IDENTITY.get(field) or item.keys()
+        return " ".join(str(item.get(key) or "") for key in keys)
+    return str(item)
+
+
+def item_sections(extraction: Dict[str, Any], sections: List[Tuple[str, str]]) -> Dict[str, List[Optional[str]]]:
+    """For each list field, the hash of the ``(hash, text)`` section each item most likely came from.
+
+    An item is attributed to the section containing the largest share of its
+    words (at least ``ATTRIBUTION_MIN_OVERLAP``); items rephrased or inferred
+    by the LLM (e.g. soft skills) are attributed to none (``None``).
+    """
+    section_tokens = [(section_hash, _tokens(text)) for section_hash, text in sections]
+    attributions = {}
+    for field, value in extraction.items():
+        if not isinstance(value, list):
+            continue
+        sources = []
+        for item in value:
+            words = _tokens(_item_text(field, item))
+            best, best_overlap = None, 0.0
+            for section_hash, tokens in section_tokens:
+                overlap = len(words & tokens) / len(words) if words else 0.0
+                if overlap > best_overlap:
+                    best, best_overlap = section_hash, overlap
+            sources.append(best if best_overlap >= ATTRIBUTION_MIN_OVERLAP else None)
+        attributions[field] = sources
+    return attributions
+
+
+def merge_extractions(previous: Dict[str, Any], delta: Dict[str, Any], sources: Dict[str, List[Optional[str]]] = None,
+                      kept_sections: Set[str] = None) -> Dict[str, Any]:
+    """Update a previous extraction with one run on the changed sections only.
+
+    Non-empty scalar fields of ``delta`` win. A previous list item is dropped
+    only if ``sources`` (see ``item_sections``) attributes it to a section that
+    is not in ``kept_sections`` any more, i.e. a section that was changed, and
+    re-extracted into ``delta``, or removed. Other items are kept; ``delta``
+    items replace the previous item with the same identity (e.g. same company
+    and position) or are appended.
+    """
+    merged = dict(previous)
+    if sources and kept_sections is not None:
+        for field, value in previous.items():
+            field_sources = sources.get(field)
+            if isinstance(value, list) and field_sources and len(field_sources) == len(value):
+                merged[field] = [item for item, source in zip(value, field_sources) if source is None or source in kept_sections]
+    for field, value in delta.items():
+        if isinstance(value, list):
+            items = list(merged.get(field) or []) if isinstance(merged.get(field), list) else []
+            positions = {_identity(field, item): i for i, item in enumerate(items)}
+            for item in value:
+                identity = _identity(field, item)
+                if identity in positions:
+                    items[positions[identity]] = item
+                else:
+                    positions[identity] = len(items)
+                    items.append(item)
+            merged[field] = items
+        elif value not in (None, "", "null"):
+            merged[field] = value
+    return merged
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Tuple, Type, TypeVar
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate_per_minute``.
+
+    ``reserve`` debits immediately and returns how long the caller must wait for
+    its reservation to be covered, so concurrent coroutines queue up in order
+    without holding a lock across ``await``.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, delta: float):
+        """Correct a previous reservation once the real cost is known (positive = refund)."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class GroqRateLimiter:
+    """Bounds concurrent requests and schedules them under a requests/min and tokens/min quota."""
+
+    def __init__(self, max_concurrency: int, requests_per_minute: float, tokens_per_minute: float,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 30.0,
+                 retryable: Tuple[Type[BaseException], ...] = ()):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable = retryable
+        self._semaphore = None
+        self._loop = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Un sémaphore asyncio est lié à une boucle ; Streamlit et asyncio.run en recréent
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    def backoff_delay(self, attempt: int, error: BaseException = None) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(self, call: Callable[[], Awaitable[T]], estimated_tokens: int) -> T:
+        """Run ``call`` under the quota, retrying retryable errors with jittered exponential backoff."""
+        async with self._get_semaphore():
+            for attempt in range(self.max_retries + 1):
+                await asyncio.sleep(max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens)))
+                try:
+                    response = await call()
+                except self.retryable as e:
+                    if attempt == self.max_retries:
+                        raise
+                    delay = self.backoff_delay(attempt, e)
+                    logging.warning(f"Requête Groq en échec ({type(e).__name__}), nouvelle tentative dans {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                usage = getattr(response, "usage", None)
+                if usage is not None and getattr(usage, "total_tokens", None):
+                    self.tokens.adjust(estimated_tokens - usage.total_tokens)
+                return response
+
+
+def _retry_after(error: BaseException):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
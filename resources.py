@@ -0,0 +1,110 @@
+"""Process-wide, lazily created models and clients.
+
+Nothing heavy (torch, sentence-transformers, groq, pinecone) is imported until
+an accessor is first called. Each accessor builds its resource once, under a
+lock, and returns the same instance afterwards; ``reset()`` drops it.
+"""
+import functools
+import logging
+import threading
+from typing import Callable, TypeVar
+
+import config
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+T = TypeVar("T")
+
+
+def lazy_resource(factory: Callable[[], T]) -> Callable[[], T]:
+    """Turn a zero-argument factory into a thread-safe, build-once accessor."""
+    lock = threading.Lock()
+    holder = []
+
+    @functools.wraps(factory)
+    def accessor() -> T:
+        if holder:
+            return holder[0]
+        with lock:
+            if not holder:
+                try:
+                    holder.append(factory())
+                except Exception as e:
+                    logging.error(f"Erreur lors de l'initialisation de {factory.__name__} : {e}")
+                    raise
+            return holder[0]
+
+    def reset():
+        with lock:
+            holder.clear()
+
+    def override(value: T):
+        """Install an already-built resource (e.g. an offline stand-in)."""
+        with lock:
+            holder[:] = [value]
+
+    accessor.reset = reset
+    accessor.override = override
+    return accessor
+
+
+@lazy_resource
+def get_embedding_model():
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(config.EMBEDDING_MODEL_NAME)
+    logging.info(f"Modèle d'embedding {config.EMBEDDING_MODEL_NAME} chargé")
+    return model
+
+
+@lazy_resource
+def get_groq_client():
+    from groq import Groq
+    from httpx import Timeout
+    if not config.GROQ_API_KEY:
+        raise ValueError("GROQ_API_KEY non défini dans les variables d'environnement.")
+    return Groq(api_key=config.GROQ_API_KEY, base_url=config.GROQ_BASE_URL, timeout=Timeout(30.0))
+
+
+@lazy_resource
+def get_async_groq_client():
+    from groq import AsyncGroq
+    from httpx import Timeout
+    if not config.GROQ_API_KEY:
+        raise ValueError("GROQ_API_KEY non défini dans les variables d'environnement.")
+    # Les tentatives sont gérées par get_groq_rate_limiter (backoff avec jitter)
+    return AsyncGroq(api_key=config.GROQ_API_KEY, base_url=config.GROQ_BASE_URL, timeout=Timeout(30.0), max_retries=0)
+
+
+@lazy_resource
+def get_groq_rate_limiter():
+    import groq
+    from rate_limiter import GroqRateLimiter
+    return GroqRateLimiter(
+        config.GROQ_MAX_CONCURRENCY, config.GROQ_REQUESTS_PER_MINUTE, config.GROQ_TOKENS_PER_MINUTE,
+        max_retries=config.GROQ_MAX_RETRIES,
+        retryable=(groq.RateLimitError, groq.APITimeoutError, groq.APIConnectionError, groq.InternalServerError)
+    )
+
+
+@lazy_resource
+def get_pinecone_client():
+    from pinecone import Pinecone
+    return Pinecone(api_key=config.PINECONE_API_KEY)
+
+
+@lazy_resource
+def get_vector_index():
+    from vector_store import initialize_vector_store
+    return initialize_vector_store(config.VECTOR_STORE_PATH, int(config.VECTOR_STORE_MAX_MEMORY_MB * 1024 * 1024), config.VECTOR_STORE_DTYPE)
+
+
+@lazy_resource
+def get_near_duplicate_index():
+    from near_duplicates import open_near_duplicate_index
+    return open_near_duplicate_index(config.VECTOR_STORE_PATH, config.NEAR_DUPLICATE_THRESHOLD, config.NEAR_DUPLICATE_MAX_ENTRIES)
+
+
+@lazy_resource
+def get_extraction_cache():
+    from llm_cache import ExtractionCache
+    return ExtractionCache(config.EXTRACTION_CACHE_PATH, config.EXTRACTION_CACHE_MEMORY_ENTRIES, config.EXTRACTION_CACHE_DISK_ENTRIES)
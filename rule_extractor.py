@@ -0,0 +1,174 @@
+"""Rule-based extraction of contact and date fields, run before the LLM.
+
+Each field comes with a confidence score; fields at or above
+``config.RULE_CONFIDENCE_THRESHOLD`` are not requested from Groq at all.
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import metrics
+from data_processor import calculate_experience_duration, parse_date
+
+# Fait partie de la clé du cache d'extraction : à incrémenter quand les règles changent
+RULES_VERSION = 1
+
+MONTHS = {
+    "janvier": 1, "janv": 1, "jan": 1, "january": 1, "février": 2, "fevrier": 2, "févr": 2, "fevr": 2, "fév": 2, "fev": 2,
+    "feb": 2, "february": 2, "mars": 3, "mar": 3, "march": 3, "avril": 4, "avr": 4, "apr": 4, "april": 4, "mai": 5,
+    "may": 5, "juin": 6, "jun": 6, "june": 6, "juillet": 7, "juil": 7, "jul": 7, "july": 7, "août": 8, "aout": 8,
+    "aug": 8, "august": 8, "septembre": 9, "sept": 9, "sep": 9, "september": 9, "octobre": 10, "oct": 10, "october": 10,
+    "novembre": 11, "nov": 11, "november": 11, "décembre": 12, "decembre": 12, "déc": 12, "dec": 12, "december": 12,
+}
+_MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+_YEAR = r"(?:19|20)\d{2}"
+_PRESENT = r"(?:présent|present|aujourd'hui|aujourd’hui|à ce jour|a ce jour|ce jour|en cours|actuel(?:lement)?|now|current|today)"
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[a-z]{2,}", re.IGNORECASE)
+PHONE_PATTERN = re.compile(r"(?<![\w+])(?:(?:\+|00)\d{1,3}[\s.-]?(?:\(0\)[\s.-]?)?\d{1,4}(?:[\s.-]?\d{2,4}){2,4}|0\d(?:[\s.-]?\d{2}){4})(?!\d)")
+PHONE_LABEL_PATTERN = re.compile(r"(?:t[ée]l[ée]?(?:phone)?|phone|mobile|gsm|portable|cell)\.?\s*[:\-]?\s*$", re.IGNORECASE)
+BIRTH_DATE_PATTERN = re.compile(
+    r"(?:n[ée]e?\s*(?:\(e\)\s*)?le|date\s+de\s+naissance|date\s+of\s+birth|birth\s*date|born\s+on|d\.?o\.?b\.?)\s*[:\-]?\s*"
+    rf"(?P<date>\d{{1,2}}[/.-]\d{{1,2}}[/.-]{_YEAR}|{_YEAR}[/.-]\d{{1,2}}[/.-]\d{{1,2}}|\d{{1,2}}(?:er)?\s+(?:{_MONTH_NAMES})\.?\s+{_YEAR}|{_YEAR})",
+    re.IGNORECASE)
+_DATE_TOKEN = rf"(?:\d{{1,2}}[/.-]{_YEAR}|{_YEAR}[/.-]\d{{1,2}}(?![/.-]?\d)|(?:{_MONTH_NAMES})\.?\s+{_YEAR}|{_YEAR})"
+DATE_RANGE_PATTERN = re.compile(
+    rf"(?:(?:depuis|since)\s+(?P<since>{_DATE_TOKEN})|(?:de\s+|du\s+|from\s+)?(?P<start>{_DATE_TOKEN})\s*(?:-|–|—|à|au|a|to|jusqu'(?:à|a|au))\s*(?P<end>{_DATE_TOKEN}|{_PRESENT}))",
+    re.IGNORECASE)
+_NUMERIC_DATE = re.compile(rf"^(?:(?P<month>\d{{1,2}})[/.-](?P<year>{_YEAR})|(?P<year2>{_YEAR})[/.-](?P<month2>\d{{1,2}}))$")
+_NAMED_DATE = re.compile(rf"^(?:(?P<day>\d{{1,2}})(?:er)?\s+)?(?P<name>{_MONTH_NAMES})\.?\s+(?P<year>{_YEAR})$", re.IGNORECASE)
+
+
+def _field(value: Any, confidence: float) -> Dict[str, Any]:
+    return {"value": value, "confidence": confidence}
+
+
+def _normalize_month_date(token: str) -> Optional[str]:
+    """'03/2019', '2019-03', 'mars 2019' -> '2019-03'; '2019' stays '2019' (formats read by parse_date)."""
+    token = token.strip()
+    if re.fullmatch(_YEAR, token):
+        return token
+    match = _NUMERIC_DATE.match(token)
+    if match:
+        year, month = (match["year"], match["month"]) if match["year"] else (match["year2"], match["month2"])
+    else:
+        match = _NAMED_DATE.match(token)
+        if not match:
+            return None
+        year, month = match["year"], MONTHS[match["name"].lower()]
+    month = int(month)
+    return f"{year}-{month:02d}" if 1 <= month <= 12 else year
+
+
+def _normalize_birth_date(token: str) -> Optional[str]:
+    """Birth date as 'YYYY-MM-DD' (or 'YYYY'), the format requested from the LLM."""
+    token = token.strip()
+    if re.fullmatch(_YEAR, token):
+        return token
+    parts = re.split(r"[/.-]", token)
+    if len(parts) == 3:
+        day, month, year = (parts[2], parts[1], parts[0]) if len(parts[0]) == 4 else parts
+    else:
+        match = _NAMED_DATE.match(token)
+        if not match or not match["day"]:
+            return None
+        day, month, year = match["day"], MONTHS[match["name"].lower()], match["year"]
+    try:
+        return datetime(int(year), int(month), int(day)).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _extract_email(cv_text: str) -> Optional[Dict[str, Any]]:
+    emails = list(dict.fromkeys(email.lower() for email in EMAIL_PATTERN.findall(cv_text)))
+    if not emails:
+        return None
+    # Plusieurs adresses : la première est souvent la principale, mais le LLM tranche mieux
+    return _field(emails[0], 0.99 if len(emails) == 1 else 0.8)
+
+
+def _extract_phone(cv_text: str) -> Optional[Dict[str, Any]]:
+    phones = []
+    labelled = set()
+    for match in PHONE_PATTERN.finditer(cv_text):
+        phone = re.sub(r"\s+", " ", match.group().strip())
+        digits = re.sub(r"\D", "", phone)
+        if not 9 <= len(digits) <= 15:
+            continue
+        if digits not in (re.sub(r"\D", "", p) for p in phones):
+            phones.append(phone)
+        if PHONE_LABEL_PATTERN.search(cv_text[max(0, match.start() - 20):match.start()]):
+            labelled.add(phone)
+    if not phones:
+        return None
+    if len(phones) == 1:
+        return _field(phones[0], 0.95)
+    principal = next((phone for phone in phones if phone in labelled), phones[0])
+    return _field(principal, 0.8)
+
+
+def _extract_birth_date(cv_text: str) -> Optional[Dict[str, Any]]:
+    match = BIRTH_DATE_PATTERN.search(cv_text)
+    if not match:
+        return None
+    value = _normalize_birth_date(match["date"])
+    if value is None:
+        return None
+    return _field(value, 0.95 if len(value) == 10 else 0.9)
+
+
+def extract_date_ranges(cv_text: str) -> List[Dict[str, str]]:
+    """Date ranges ('03/2019 - Présent', 'janv. 2018 à juin 2020', 'depuis 2021') in the
+    ``{"date_debut", "date_fin"}`` shape read by ``calculate_experience_duration``."""
+    ranges = []
+    for match in DATE_RANGE_PATTERN.finditer(cv_text):
+        if match["since"]:
+            start, end = _normalize_month_date(match["since"]), "Présent"
+        else:
+            start = _normalize_month_date(match["start"])
+            end = _normalize_month_date(match["end"]) or "Présent"
+        if start is None:
+            continue
+        start_year, end_year = parse_date(start), parse_date(end)
+        if start_year is None or end_year is None or not 0 <= end_year - start_year <= 50:
+            continue
+        ranges.append({"date_debut": start, "date_fin": end})
+    return ranges
+
+
+@metrics.span("rule_extraction")
+def extract_rule_fields(cv_text: str) -> Dict[str, Dict[str, Any]]:
+    """Pattern-based fields with their confidence: ``{field: {"value", "confidence"}}``.
+
+    ``periodes`` lists every date range found; they cannot be told apart from
+    education periods without the LLM, hence their lower confidence.
+    """
+    fields = {}
+    for name, extract in (("email", _extract_email), ("telephone", _extract_phone), ("date_naissance", _extract_birth_date)):
+        field = extract(cv_text)
+        if field is not None:
+            fields[name] = field
+    ranges = extract_date_ranges(cv_text)
+    if ranges:
+        fields["periodes"] = _field(ranges, 0.6)
+    return fields
+
+
+def confident_fields(rule_fields: Dict[str, Dict[str, Any]], threshold: float) -> Dict[str, Any]:
+    """Schema fields whose rule confidence is high enough to skip asking the LLM."""
+    return {name: field["value"] for name, field in rule_fields.items()
+            if name != "periodes" and field["confidence"] >= threshold}
+
+
+def quick_screen(cv_text: str) -> Dict[str, Any]:
+    """Contact details and an experience estimate without any LLM call."""
+    rule_fields = extract_rule_fields(cv_text)
+    result = {name: rule_fields[name]["value"] if name in rule_fields else None for name in ("email", "telephone", "date_naissance")}
+    birth_year = int(result["date_naissance"][:4]) if result["date_naissance"] else None
+    result["age"] = datetime.now().year - birth_year if birth_year else None
+    periods = rule_fields.get("periodes", {}).get("value", [])
+    result["periodes"] = periods
+    # Estimation haute : les périodes de formation détectées sont comptées aussi
+    result["experience_annees_estimee"] = calculate_experience_duration(periods) if periods else 0
+    result["confiance_regles"] = {name: field["confidence"] for name, field in rule_fields.items()}
+    return result
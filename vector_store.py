@@ -1,18 +1,901 @@
+import functools
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+import metrics
+
+MANIFEST_FILE = "manifest.json"
+DOCUMENTS_FILE = "documents.json"
+ANN_FILE = "ivf.npz"
+
+# Compactage de la queue en mémoire dès que les lignes supprimées y sont majoritaires
+TAIL_COMPACTION_MIN_DEAD = 64
+
+# Sous ce nombre de lignes vivantes, le parcours exhaustif reste plus rapide que l'index IVF
+ANN_MIN_ROWS = 20000
+# Listes inversées sondées par requête : le compromis rappel / vitesse
+DEFAULT_NPROBE = 8
+ANN_TRAIN_POINTS_PER_LIST = 32
+# Lignes ajoutées depuis la dernière construction des listes, parcourues à part avant reconstruction
+ANN_MAX_PENDING_FRACTION = 0.1
+
+# Valeur attendue, liste de valeurs acceptées ou prédicat
+FilterValue = Union[Any, List[Any], Callable[[Any], bool]]
+
+# Type de stockage des vecteurs parcourus à la recherche -> extension des fichiers de segment
+STORAGE_DTYPES = {"float32": ".f32", "float16": ".f16", "int8": ".i8"}
+SCALES_EXTENSION = ".scales"
+# Stockage quantifié : candidats rescorés en pleine précision par résultat demandé
+RESCORE_FACTOR = 4
+
+_MISSING = object()
+
+
+class SegmentRecord(Mapping):
+    """Read-only metadata of one indexed row.
+
+    The usual ``file_name``, ``segment`` and ``segment_text`` keys live in
+    slots rather than in a per-row dict; any other key goes to ``extra``.
+    """
+
+    __slots__ = ("file_name", "segment", "segment_text", "extra")
+    FIELDS = ("file_name", "segment", "segment_text")
+
+    def __init__(self, metadata: Dict[str, Any]):
+        file_name = metadata.get("file_name", _MISSING)
+        # Noms de fichier partagés entre les segments d'un même CV, y compris après rechargement
+        self.file_name = sys.intern(file_name) if isinstance(file_name, str) else file_name
+        self.segment = metadata.get("segment", _MISSING)
+        self.segment_text = metadata.get("segment_text", _MISSING)
+        self.extra = {key: value for key, value in metadata.items() if key not in self.FIELDS} or None
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if getattr(self, key) is not _MISSING:
+                yield key
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"SegmentRecord({dict(self)!r})"
+
+
+def _locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class SimpleIndex:
-    def __init__(self):
-        self.vectors = []
+    """Vector index backed by a growable float32 matrix of normalized rows.
+
+    Rows loaded from disk stay in read-only ``np.memmap`` segments shared through
+    the page cache; new upserts go to an in-memory tail that ``save`` appends as
+    a new segment.
+
+    Ids are unique per namespace: upserting an existing id replaces it. Rows are
+    grouped into documents by their ``file_name`` metadata, which can be deleted
+    as a whole. Once the in-memory tail exceeds ``max_memory_bytes``, it is
+    saved as a new segment when the index has a path, otherwise its documents
+    are evicted least recently used first; saved rows are never evicted.
+    Deleted rows are tombstoned and reclaimed by tail compaction or ``compact``.
+
+    ``build_ann`` adds an IVF coarse quantizer (spherical k-means centroids)
+    used by ``search`` and ``search_candidates`` to scan only the ``nprobe``
+    closest inverted lists instead of the whole matrix.
+
+    With a ``float16`` or ``int8`` ``dtype`` (int8 with one scale per vector),
+    ``save`` writes quantized codes next to the float32 embeddings of each
+    segment. Searches scan the codes of the saved rows and the float32 tail,
+    then rescore the ``RESCORE_FACTOR * k`` best rows against the
+    memory-mapped float32 embeddings. The tail is only ever held in float32,
+    so an index without a path behaves as in ``float32`` mode.
+    """
+
+    def __init__(self, dim: int = None, initial_capacity: int = 1024, max_memory_bytes: int = None, dtype: str = "float32"):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Type de stockage inconnu : {dtype} (attendu {', '.join(STORAGE_DTYPES)})")
+        self.dim = dim
+        self.dtype = dtype
+        self.path = None
+        self.max_memory_bytes = max_memory_bytes
+        self._lock = threading.RLock()
+        self.ids: List[Optional[str]] = []
+        self.metadata: List[Optional[SegmentRecord]] = []
+        self.live_count = 0
+        self._namespace_names: List[str] = []
+        self._namespace_codes: Dict[str, int] = {}
+        self._row_namespace = np.zeros(initial_capacity, dtype=np.int32)
+        self._row_list = np.full(initial_capacity, -1, dtype=np.int32)
+        self._alive = np.zeros(initial_capacity, dtype=bool)
+        self._scales = np.ones(initial_capacity, dtype=np.float32)
+        self._positions: Dict[Tuple[str, str], int] = {}
+        self._documents: "OrderedDict[Tuple[str, str], Set[int]]" = OrderedDict()
+        self._document_fields: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._ann_trained_rows = 0
+        self._ivf_order: Optional[np.ndarray] = None
+        self._ivf_offsets: Optional[np.ndarray] = None
+        self._ivf_rows = 0
+        # (nom, embeddings float32, codes parcourus à la recherche) ; codes = embeddings en float32
+        self._segments: List[Tuple[str, np.ndarray, np.ndarray]] = []
+        self._segment_rows = 0
+        self._tail_size = 0
+        self._tail_dead = 0
+        self._initial_capacity = initial_capacity
+        self._matrix = np.empty((initial_capacity, dim), dtype=np.float32) if dim else None
+
+    @property
+    def size(self) -> int:
+        """Number of rows, tombstoned ones included."""
+        return self._segment_rows + self._tail_size
+
+    def __len__(self):
+        return self.live_count
+
+    @property
+    def quantized(self) -> bool:
+        return self.dtype != "float32"
+
+    @property
+    def bytes_per_vector(self) -> int:
+        """Bytes scanned per saved vector, scale included."""
+        return (self.dim or 0) * np.dtype(self.dtype).itemsize + (4 if self.dtype == "int8" else 0)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Embedding memory of the live in-memory tail (what ``max_memory_bytes`` caps).
+
+        Saved segments are memory-mapped and left to the page cache, so they are not counted.
+        """
+        return (self._tail_size - self._tail_dead) * (self.dim or 0) * 4
+
+    @_locked
+    def memory_stats(self) -> Dict[str, Any]:
+        """Memory per vector and in total: scanned codes of saved rows, float32 tail and metadata records."""
+        live = self.live_count
+        unsaved = self._tail_size - self._tail_dead
+        metadata_bytes = sum(sys.getsizeof(record) + sys.getsizeof(record.extra or ()) + sys.getsizeof(_id)
+                             for _id, record in zip(self.ids, self.metadata) if record is not None)
+        return {
+            "dtype": self.dtype,
+            "vectors": live,
+            "unsaved_vectors": unsaved,
+            "dim": self.dim,
+            "bytes_per_vector": self.bytes_per_vector,
+            "float32_bytes_per_vector": (self.dim or 0) * 4,
+            # Codes mappés (cache de pages) des lignes sauvegardées + queue float32 en mémoire
+            "scanned_bytes": (live - unsaved) * self.bytes_per_vector + self.memory_bytes,
+            "memory_bytes": self.memory_bytes,
+            "metadata_bytes_per_vector": round(metadata_bytes / live, 1) if live else 0,
+        }
+
+    def _blocks(self) -> List[np.ndarray]:
+        """Float32 embeddings, block by block (segments, then the in-memory tail)."""
+        blocks = [embeddings for _, embeddings, _ in self._segments]
+        if self._tail_size:
+            blocks.append(self._matrix[:self._tail_size])
+        return blocks
+
+    def _code_blocks(self) -> List[np.ndarray]:
+        """Searched representation, aligned with ``_blocks``: segment codes, then the float32 tail."""
+        blocks = [codes for _, _, codes in self._segments]
+        if self._tail_size:
+            blocks.append(self._matrix[:self._tail_size])
+        return blocks
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """All rows of the embedding matrix, tombstones included (a copy when segments are on disk)."""
+        blocks = self._blocks()
+        if not blocks:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+
+    def _take(self, rows: np.ndarray, blocks: List[np.ndarray] = None) -> np.ndarray:
+        """Embeddings (or codes, from ``_code_blocks``) of the given sorted global rows, gathered across segments and tail."""
+        parts, offset = [], 0
+        for block in self._blocks() if blocks is None else blocks:
+            selected = rows[(rows >= offset) & (rows < offset + len(block))]
+            if len(selected):
+                parts.append(block[selected - offset])
+            offset += len(block)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def _namespace_code(self, namespace: str) -> int:
+        code = self._namespace_codes.get(namespace)
+        if code is None:
+            code = self._namespace_codes[namespace] = len(self._namespace_names)
+            self._namespace_names.append(namespace)
+        return code
+
+    def _reserve(self, count: int):
+        needed_rows = self.size + count
+        if needed_rows > len(self._alive):
+            capacity = max(needed_rows, 2 * len(self._alive))
+            self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+            self._row_namespace = np.concatenate([self._row_namespace, np.zeros(capacity - len(self._row_namespace), dtype=np.int32)])
+            self._row_list = np.concatenate([self._row_list, np.full(capacity - len(self._row_list), -1, dtype=np.int32)])
+            self._scales = np.concatenate([self._scales, np.ones(capacity - len(self._scales), dtype=np.float32)])
+        needed = self._tail_size + count
+        if self._matrix is None or needed <= self._matrix.shape[0]:
+            return
+        capacity = max(needed, 2 * self._matrix.shape[0])
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        grown[:self._tail_size] = self._matrix[:self._tail_size]
+        self._matrix = grown
+
+    def _register(self, row: int, _id: str, metadata: Dict[str, Any], namespace: str):
+        self._alive[row] = True
+        self._row_namespace[row] = self._namespace_code(namespace)
+        self._positions[(namespace, _id)] = row
+        document = (namespace, metadata.get("file_name", _id))
+        self._documents.setdefault(document, set()).add(row)
+        self._documents.move_to_end(document)
+        self.live_count += 1
+
+    def _kill(self, row: int):
+        namespace = self._namespace_names[self._row_namespace[row]]
+        metadata = self.metadata[row]
+        document = (namespace, metadata.get("file_name", self.ids[row]))
+        rows = self._documents.get(document)
+        if rows is not None:
+            rows.discard(row)
+            if not rows:
+                del self._documents[document]
+                self._document_fields.pop(document, None)
+        self._positions.pop((namespace, self.ids[row]), None)
+        self._alive[row] = False
+        self.ids[row] = None
+        self.metadata[row] = None
+        self.live_count -= 1
+        if row >= self._segment_rows:
+            self._tail_dead += 1
+
+    @_locked
+    def upsert(self, vectors, namespace: str = ""):
+        vectors = list(vectors)
+        if not vectors:
+            return
+        embeddings = _normalize(np.asarray([embedding for _, embedding, _ in vectors], dtype=np.float32))
+        if self._matrix is None:
+            self.dim = embeddings.shape[1]
+            self._matrix = np.empty((max(self._initial_capacity, len(vectors)), self.dim), dtype=np.float32)
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(f"Dimension d'embedding invalide : {embeddings.shape[1]} (attendu {self.dim})")
+        self._reserve(len(vectors))
+        self._matrix[self._tail_size:self._tail_size + len(vectors)] = embeddings
+        first_row = self.size
+        # La queue est parcourue en float32 : quantifiée seulement à l'écriture du segment
+        self._scales[first_row:first_row + len(vectors)] = 1.0
+        if self._centroids is not None:
+            self._row_list[first_row:first_row + len(vectors)] = _assign_lists(embeddings, self._centroids)
+        self._tail_size += len(vectors)
+        touched = set()
+        records = [SegmentRecord(metadata) for _, _, metadata in vectors]
+        for (_id, _, _), record in zip(vectors, records):
+            self.ids.append(_id)
+            self.metadata.append(record)
+        for offset, ((_id, _, _), metadata) in enumerate(zip(vectors, records)):
+            previous = self._positions.get((namespace, _id))
+            if previous is not None:
+                self._kill(previous)
+            self._register(first_row + offset, _id, metadata, namespace)
+            touched.add((namespace, metadata.get("file_name", _id)))
+        self._enforce_memory_limit(protected=touched)
+        self._maybe_compact_tail()
+
+    @_locked
+    def delete(self, ids: Iterable[str] = None, file_name: str = None, namespace: str = "", delete_all: bool = False) -> int:
+        """Delete by ids, by document (``file_name``) or, with ``delete_all``, a whole namespace.
+
+        Returns the number of rows removed.
+        """
+        if ids is not None:
+            rows = [self._positions[(namespace, _id)] for _id in ids if (namespace, _id) in self._positions]
+        elif file_name is not None:
+            rows = list(self._documents.get((namespace, file_name), ()))
+        elif delete_all:
+            rows = [row for (document_namespace, _), document_rows in self._documents.items() if document_namespace == namespace for row in document_rows]
+        else:
+            raise ValueError("Préciser ids, file_name ou delete_all.")
+        for row in rows:
+            self._kill(row)
+        self._maybe_compact_tail()
+        return len(rows)
+
+    @_locked
+    def documents(self, namespace: str = None) -> List[Tuple[str, str]]:
+        """(namespace, file_name) of the live documents, least recently used first."""
+        return [document for document in self._documents if namespace is None or document[0] == namespace]
+
+    def _enforce_memory_limit(self, protected: Set[Tuple[str, str]] = frozenset()):
+        if self.max_memory_bytes is None or self.memory_bytes <= self.max_memory_bytes:
+            return
+        if self.path is not None:
+            # Index persistant : la queue devient un segment mappé au lieu d'être évincée
+            logging.info(f"Index vectoriel plein : écriture de {self._tail_size} lignes en mémoire dans {self.path}")
+            self.save()
+            return
+        for document in list(self._documents):
+            if self.memory_bytes <= self.max_memory_bytes:
+                break
+            if document in protected:
+                continue
+            logging.info(f"Index vectoriel plein : éviction du document {document[1]} ({document[0] or 'défaut'})")
+            # Seules les lignes de la queue sont évincées : une ligne sauvegardée ne coûte pas de mémoire
+            for row in [row for row in self._documents[document] if row >= self._segment_rows]:
+                self._kill(row)
+
+    def _maybe_compact_tail(self):
+        if self._tail_dead >= TAIL_COMPACTION_MIN_DEAD and self._tail_dead * 2 >= self._tail_size:
+            self._compact_tail()
+
+    def _compact_tail(self):
+        start = self._segment_rows
+        keep = np.flatnonzero(self._alive[start:self.size])
+        remap = {start + int(old): start + new for new, old in enumerate(keep)}
+        self._matrix[:len(keep)] = self._matrix[keep]
+        self._scales[start:start + len(keep)] = self._scales[start + keep]
+        self.ids[start:] = [self.ids[start + int(old)] for old in keep]
+        self.metadata[start:] = [self.metadata[start + int(old)] for old in keep]
+        self._row_namespace[start:start + len(keep)] = self._row_namespace[start + keep]
+        self._row_list[start:start + len(keep)] = self._row_list[start + keep]
+        self._row_list[start + len(keep):self.size] = -1
+        if self._ivf_rows > start:
+            self._ivf_order = None
+        self._alive[start:start + len(keep)] = True
+        self._alive[start + len(keep):self.size] = False
+        self._tail_size = len(keep)
+        self._tail_dead = 0
+        for key, row in self._positions.items():
+            if row >= start:
+                self._positions[key] = remap[row]
+        for rows in self._documents.values():
+            moved = [row for row in rows if row >= start]
+            rows.difference_update(moved)
+            rows.update(remap[row] for row in moved)
+
+    def _touch(self, rows: Iterable[int]):
+        for row in rows:
+            namespace = self._namespace_names[self._row_namespace[row]]
+            document = (namespace, self.metadata[row].get("file_name", self.ids[row]))
+            if document in self._documents:
+                self._documents.move_to_end(document)
+
+    def query(self, embedding, k: int = 3, namespace: str = None, file_name: str = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Return the k most similar entries as (id, cosine score, metadata), best first."""
+        return self.query_batch(np.asarray(embedding, dtype=np.float32)[None, :], k, namespace, file_name)[0]
+
+    @_locked
+    def query_batch(self, embeddings, k: int = 3, namespace: str = None, file_name: str = None) -> List[List[Tuple[str, float, Dict[str, Any]]]]:
+        """Top-k search for several query embeddings with a single matrix product.
+
+        ``namespace`` restricts the search to one namespace (all by default);
+        ``file_name`` only scans the rows of that document.
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        if self.live_count == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+        if file_name is not None:
+            # Quelques lignes : score exact directement, sans passer par les codes
+            rows = self._document_rows(file_name, namespace)
+            if not len(rows):
+                return [[] for _ in range(len(queries))]
+            scores = queries @ self._take(rows).T
+        else:
+            rows = np.arange(self.size)
+            scores = self._code_scores(queries, self._code_blocks(), self._scales[:self.size])
+            mask = self._alive[:self.size]
+            if namespace is not None:
+                mask = mask & (self._row_namespace[:self.size] == self._namespace_codes.get(namespace, -1))
+            if not mask.all():
+                rows, scores = rows[mask], scores[:, mask]
+        results = []
+        for query, row_scores in zip(queries, scores):
+            if file_name is None:
+                top_rows, top_scores = self._rescore(query, rows, row_scores, k)
+            else:
+                top = _top_k(row_scores, k)
+                top_rows, top_scores = rows[top], row_scores[top]
+            self._touch(top_rows)
+            results.append([(self.ids[row], float(score), dict(self.metadata[row])) for row, score in zip(top_rows, top_scores)])
+        return results
+
+    def _code_scores(self, queries: np.ndarray, blocks: List[np.ndarray], scales: np.ndarray) -> np.ndarray:
+        """Similarity of the queries with the rows of the given code blocks (approximate when quantized)."""
+        scores = np.concatenate([_dot(queries, block) for block in blocks], axis=1) if len(blocks) > 1 else _dot(queries, blocks[0])
+        if self.dtype == "int8":
+            scores *= scales
+        return scores
+
+    def _rescore(self, query: np.ndarray, rows: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k rows, best first; quantized scores are recomputed on the memory-mapped float32 embeddings of the best candidates."""
+        top = _top_k(scores, k * RESCORE_FACTOR if self.quantized else k)
+        if not self.quantized or not len(top):
+            return rows[top], scores[top]
+        candidates = np.sort(rows[top])
+        exact = self._take(candidates) @ query
+        top = _top_k(exact, k)
+        return candidates[top], exact[top]
+
+    @_locked
+    def document_segments(self, file_name: str, namespace: str = "") -> List[Tuple[Dict[str, Any], np.ndarray]]:
+        """(metadata, normalized embedding) of each live row of a document."""
+        rows = np.asarray(sorted(self._documents.get((namespace, file_name), ())), dtype=np.int64)
+        if not len(rows):
+            return []
+        return list(zip((dict(self.metadata[row]) for row in rows), self._take(rows)))
+
+    @_locked
+    def set_document_fields(self, file_name: str, fields: Dict[str, Any], namespace: str = ""):
+        """Attach candidate-level fields (e.g. extracted ``discipline``) usable as search filters."""
+        document = (namespace, file_name)
+        if document in self._documents:
+            self._document_fields.setdefault(document, {}).update(fields)
+
+    def document_fields(self, file_name: str, namespace: str = "") -> Dict[str, Any]:
+        return dict(self._document_fields.get((namespace, file_name), {}))
+
+    @_locked
+    def build_ann(self, n_lists: int = None, iterations: int = 8, seed: int = 0):
+        """Train the IVF centroids on a sample of live rows and assign every row to its list.
+
+        ``n_lists`` defaults to about sqrt(live rows).
+        """
+        live = np.flatnonzero(self._alive[:self.size])
+        if not len(live):
+            return
+        n_lists = max(1, min(n_lists or int(math.sqrt(len(live))), len(live)))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(live, size=min(len(live), n_lists * ANN_TRAIN_POINTS_PER_LIST), replace=False))
+        self._centroids = _train_centroids(self._take(sample), n_lists, iterations, rng)
+        offset = 0
+        # L'échelle propre à chaque vecteur ne change pas la liste la plus proche : les codes suffisent
+        for block in self._code_blocks():
+            self._row_list[offset:offset + len(block)] = _assign_lists(block, self._centroids)
+            offset += len(block)
+        self._ann_trained_rows = len(live)
+        self._ivf_order = None
+        logging.info(f"Index IVF construit : {n_lists} listes pour {len(live)} segments")
+
+    @_locked
+    def ensure_ann(self, min_rows: int = ANN_MIN_ROWS):
+        """Build the IVF index once the corpus is large enough, and retrain it after 4x growth."""
+        if self.live_count >= min_rows and (self._centroids is None or self.live_count > 4 * self._ann_trained_rows):
+            self.build_ann()
+
+    def _ivf_lists(self):
+        pending = self.size - self._ivf_rows
+        if self._ivf_order is None or pending > max(1024, ANN_MAX_PENDING_FRACTION * self.size):
+            row_list = self._row_list[:self.size]
+            self._ivf_order = np.argsort(row_list, kind="stable").astype(np.int64)
+            counts = np.bincount(row_list[row_list >= 0], minlength=len(self._centroids))
+            # Les lignes non assignées (-1) sont triées en tête ; elles sont ignorées via les offsets
+            self._ivf_offsets = np.concatenate([[0], np.cumsum(counts)]) + int((row_list < 0).sum())
+            self._ivf_rows = self.size
+        return self._ivf_order, self._ivf_offsets
+
+    def _candidate_rows(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Rows of the ``nprobe`` inverted lists closest to ``query``, plus rows not yet listed."""
+        order, offsets = self._ivf_lists()
+        probes = np.argsort(-(self._centroids @ query))[:nprobe]
+        parts = [order[offsets[probe]:offsets[probe + 1]] for probe in probes]
+        pending = np.arange(self._ivf_rows, self.size)
+        if len(pending):
+            pending_lists = self._row_list[pending]
+            parts.append(pending[np.isin(pending_lists, probes) | (pending_lists < 0)])
+        # Lignes ajoutées avant la création des centroïdes mais après la dernière construction
+        parts.append(order[:offsets[0]])
+        return np.sort(np.concatenate(parts))
+
+    def _document_rows(self, file_name: str, namespace: Optional[str]) -> np.ndarray:
+        """Rows of the document ``file_name`` in ``namespace``, or in every namespace if ``None``."""
+        namespaces = self._namespace_names if namespace is None else [namespace]
+        return np.asarray(sorted(row for name in namespaces for row in self._documents.get((name, file_name), ())), dtype=np.int64)
+
+    def _filter_rows(self, rows: np.ndarray, namespace: Optional[str], filters: Optional[Dict[str, FilterValue]]) -> np.ndarray:
+        rows = rows[self._alive[rows]]
+        if namespace is not None:
+            rows = rows[self._row_namespace[rows] == self._namespace_codes.get(namespace, -1)]
+        if not filters:
+            return rows
+        kept = []
+        for row in rows:
+            metadata = self.metadata[row]
+            fields = self._document_fields.get((self._namespace_names[self._row_namespace[row]], metadata.get("file_name", self.ids[row])), {})
+            if all(_match_filter(metadata[key] if key in metadata else fields.get(key), expected) for key, expected in filters.items()):
+                kept.append(row)
+        return np.asarray(kept, dtype=np.int64)
+
+    def _scored_rows(self, query: np.ndarray, min_rows: int, nprobe: Optional[int], namespace: Optional[str], filters: Optional[Dict[str, FilterValue]]) -> Tuple[np.ndarray, np.ndarray]:
+        file_name = (filters or {}).get("file_name")
+        if isinstance(file_name, str):
+            rows = self._filter_rows(self._document_rows(file_name, namespace), namespace, filters)
+        elif self._centroids is None or self.live_count < ANN_MIN_ROWS:
+            rows = self._filter_rows(np.arange(self.size), namespace, filters)
+        else:
+            nprobe = nprobe or DEFAULT_NPROBE
+            while True:
+                rows = self._filter_rows(self._candidate_rows(query, nprobe), namespace, filters)
+                # Filtre sélectif : on élargit la sonde plutôt que de rendre moins de k résultats
+                if len(rows) >= min_rows or nprobe >= len(self._centroids):
+                    break
+                nprobe *= 2
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+        return rows, self._code_scores(query[None, :], [self._take(rows, self._code_blocks())], self._scales[rows])[0]
+
+    @_locked
+    def search(self, embedding, k: int = 3, nprobe: int = None, namespace: str = None,
+               filters: Dict[str, FilterValue] = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Approximate top-k segments, pre-filtered on metadata and document fields.
+
+        ``filters`` maps a field (``file_name``, ``segment``, or a document field
+        such as ``discipline``) to a value, a list of accepted values or a
+        predicate. Without IVF centroids, or on small indexes, the scan is exact.
+        """
+        query = _normalize(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        rows, scores = self._scored_rows(query, k, nprobe, namespace, filters)
+        rows, scores = self._rescore(query, rows, scores, k)
+        self._touch(rows)
+        return [(self.ids[row], float(score), dict(self.metadata[row])) for row, score in zip(rows, scores)]
+
+    @_locked
+    def search_candidates(self, embedding, top_n: int = 10, segments_per_candidate: int = 3, nprobe: int = None,
+                          namespace: str = None, filters: Dict[str, FilterValue] = None) -> List[Dict[str, Any]]:
+        """Best matching documents (candidates), scored by their best segment.
+
+        Each result holds ``file_name``, ``namespace``, ``score``, the document
+        fields and up to ``segments_per_candidate`` matching segments.
+        """
+        query = _normalize(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        rows, scores = self._scored_rows(query, top_n * segments_per_candidate, nprobe, namespace, filters)
+        best_rows, best_scores = self._rescore(query, rows, scores, top_n * segments_per_candidate)
+        # Au-delà des meilleures lignes rescorées, les suivantes gardent leur score approché
+        best = set(best_rows.tolist())
+        rest = ((rows[i], scores[i]) for i in _top_k(scores, len(scores)) if rows[i] not in best)
+        candidates: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        for row, score in itertools.chain(zip(best_rows, best_scores), rest):
+            metadata = self.metadata[row]
+            document = (self._namespace_names[self._row_namespace[row]], metadata.get("file_name", self.ids[row]))
+            candidate = candidates.get(document)
+            if candidate is None:
+                if len(candidates) == top_n:
+                    continue
+                candidate = candidates[document] = {"file_name": document[1], "namespace": document[0], "score": float(score),
+                                                    "fields": dict(self._document_fields.get(document, {})), "segments": []}
+            if len(candidate["segments"]) < segments_per_candidate:
+                candidate["segments"].append((self.ids[row], float(score), dict(metadata)))
+        return list(candidates.values())
+
+    @_locked
+    def save(self, path: str = None):
+        """Persist the index under ``path``.
+
+        Saving back to the directory the index was loaded from only appends the
+        rows upserted since, as a new segment, and records deleted rows in the
+        manifest; the in-memory tail is then swapped for the memory-mapped
+        segment in place, without re-reading the saved ones. Any other
+        directory receives a full copy in a single segment.
+        """
+        path = path or self.path
+        if path is None:
+            raise ValueError("Aucun répertoire de sauvegarde défini pour l'index.")
+        os.makedirs(path, exist_ok=True)
+        if self._tail_dead:
+            self._compact_tail()
+        incremental = path == self.path and os.path.exists(os.path.join(path, MANIFEST_FILE))
+        if incremental:
+            manifest = _read_manifest(path)
+            rows = np.arange(self._segment_rows, self.size)
+            saved_rows = np.arange(self.size)
+        else:
+            manifest = {"dim": self.dim, "next_segment": 0, "segments": []}
+            rows = saved_rows = np.flatnonzero(self._alive[:self.size])
+        manifest["deleted"] = [int(row) for row in np.flatnonzero(~self._alive[:self._segment_rows])] if path == self.path else []
+        if len(rows):
+            manifest["dim"] = self.dim
+            self._append_rows(path, manifest, rows)
+        _write_manifest(path, manifest)
+        self._write_extras(path, saved_rows)
+        if incremental or not self._segments:
+            # Lignes écrites dans leur ordre actuel : seule la queue change de support
+            if len(rows):
+                self._adopt_segment(path, manifest["segments"][-1])
+            self.path = path
+        else:
+            self._reload(path)
+
+    def _adopt_segment(self, path: str, segment: Dict[str, Any]):
+        """Replace the in-memory tail by the segment it was just saved as."""
+        first_row = self._segment_rows
+        embeddings = _open_segment(path, segment, self.dim)
+        codes = embeddings
+        if self.quantized:
+            codes, scales = _open_codes(path, segment, self.dim, self.dtype)
+            self._scales[first_row:first_row + segment["count"]] = scales
+        self._segments.append((segment["name"], embeddings, codes))
+        self._segment_rows = first_row + segment["count"]
+        self._tail_size = 0
+        self._tail_dead = 0
+        self._matrix = np.empty((self._initial_capacity, self.dim), dtype=np.float32)
+
+    @_locked
+    def compact(self):
+        """Rewrite the live rows of the saved index as a single segment."""
+        self.save()
+        old_segments = [name for name, _, _ in self._segments]
+        manifest = _read_manifest(self.path)
+        manifest["segments"] = []
+        manifest["deleted"] = []
+        rows = np.flatnonzero(self._alive[:self.size])
+        if len(rows):
+            self._append_rows(self.path, manifest, rows)
+        _write_manifest(self.path, manifest)
+        self._write_extras(self.path, rows)
+        self._reload(self.path)
+        for name in old_segments:
+            for extension in (".jsonl", SCALES_EXTENSION, *STORAGE_DTYPES.values()):
+                if os.path.exists(os.path.join(self.path, name + extension)):
+                    os.remove(os.path.join(self.path, name + extension))
+
+    def _append_rows(self, path: str, manifest: Dict[str, Any], rows: np.ndarray):
+        records = [(self.ids[row], self._namespace_names[self._row_namespace[row]], dict(self.metadata[row])) for row in rows]
+        embeddings = self._take(rows)
+        codes, scales = _quantize(embeddings, self.dtype) if self.quantized else (None, None)
+        _append_segment(path, manifest, embeddings, records, codes, scales if self.dtype == "int8" else None)
+
+    def _write_extras(self, path: str, rows: np.ndarray):
+        """Document fields and IVF lists; ``rows`` are the current rows in their saved order."""
+        with open(os.path.join(path, DOCUMENTS_FILE + ".tmp"), "w", encoding="utf-8") as f:
+            json.dump([[namespace, file_name, fields] for (namespace, file_name), fields in self._document_fields.items()], f, ensure_ascii=False)
+        os.replace(os.path.join(path, DOCUMENTS_FILE + ".tmp"), os.path.join(path, DOCUMENTS_FILE))
+        ann_path = os.path.join(path, ANN_FILE)
+        if self._centroids is None:
+            if os.path.exists(ann_path):
+                os.remove(ann_path)
+            return
+        with open(ann_path + ".tmp", "wb") as f:
+            np.savez(f, centroids=self._centroids, row_list=self._row_list[rows], trained_rows=self._ann_trained_rows)
+        os.replace(ann_path + ".tmp", ann_path)
+
+    def _reload(self, path: str):
+        loaded = SimpleIndex.load(path, self._initial_capacity, self.max_memory_bytes, self.dtype)
+        loaded._lock = self._lock
+        self.__dict__.update(loaded.__dict__)
+
+    @classmethod
+    def load(cls, path: str, initial_capacity: int = 1024, max_memory_bytes: int = None, dtype: str = "float32") -> "SimpleIndex":
+        """Open a saved index; embeddings and codes are memory-mapped read-only, not copied.
+
+        Segments saved with another ``dtype`` are quantized again in memory
+        until the next ``compact``.
+        """
+        manifest = _read_manifest(path)
+        index = cls(dim=manifest["dim"], initial_capacity=initial_capacity, max_memory_bytes=max_memory_bytes, dtype=dtype)
+        records = []
+        for segment in manifest["segments"]:
+            with open(os.path.join(path, segment["name"] + ".jsonl"), encoding="utf-8") as sidecar:
+                records.extend(json.loads(line) for line in sidecar)
+        index.path = path
+        index._segment_rows = len(records)
+        index._reserve(0)
+        offset = 0
+        for segment in manifest["segments"]:
+            embeddings = _open_segment(path, segment, index.dim)
+            codes = embeddings
+            if index.quantized:
+                codes, scales = _open_codes(path, segment, index.dim, dtype)
+                if codes is None:
+                    logging.info(f"Segment {segment['name']} enregistré en {segment.get('dtype', 'float32')} : quantification en {dtype}")
+                    codes, scales = _quantize(embeddings, dtype)
+                index._scales[offset:offset + segment["count"]] = scales
+            index._segments.append((segment["name"], embeddings, codes))
+            offset += segment["count"]
+        deleted = set(manifest.get("deleted", ()))
+        for row, record in enumerate(records):
+            metadata = SegmentRecord(record["metadata"])
+            index.ids.append(record["id"])
+            index.metadata.append(metadata)
+            if row in deleted:
+                index._row_namespace[row] = index._namespace_code(record.get("namespace", ""))
+                index.ids[row] = None
+                index.metadata[row] = None
+            else:
+                index._register(row, record["id"], metadata, record.get("namespace", ""))
+        if os.path.exists(os.path.join(path, DOCUMENTS_FILE)):
+            with open(os.path.join(path, DOCUMENTS_FILE), encoding="utf-8") as f:
+                for namespace, file_name, fields in json.load(f):
+                    if (namespace, file_name) in index._documents:
+                        index._document_fields[(namespace, file_name)] = fields
+        if os.path.exists(os.path.join(path, ANN_FILE)):
+            with np.load(os.path.join(path, ANN_FILE)) as ann:
+                # Listes écrites pour une autre version du manifeste : l'index IVF sera reconstruit
+                if len(ann["row_list"]) == len(records):
+                    index._centroids = ann["centroids"]
+                    index._row_list[:len(records)] = ann["row_list"]
+                    index._ann_trained_rows = int(ann["trained_rows"])
+        return index
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _quantize(embeddings: np.ndarray, dtype: str, chunk_size: int = 16384) -> Tuple[np.ndarray, np.ndarray]:
+    """Codes and per-vector scales of normalized rows: int8 codes scaled to their row's max, or a plain float16 cast."""
+    codes = np.empty(embeddings.shape, dtype=dtype)
+    scales = np.ones(len(embeddings), dtype=np.float32)
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+        if dtype == "int8":
+            chunk_scales = np.abs(chunk).max(axis=1) / 127
+            chunk_scales[chunk_scales == 0] = 1.0
+            codes[start:start + len(chunk)] = np.rint(chunk / chunk_scales[:, None])
+            scales[start:start + len(chunk)] = chunk_scales
+        else:
+            codes[start:start + len(chunk)] = chunk
+    return codes, scales
+
+
+def _dot(queries: np.ndarray, codes: np.ndarray, chunk_size: int = 16384) -> np.ndarray:
+    """``queries @ codes.T`` in float32, converting quantized codes by chunks to bound memory."""
+    if codes.dtype == np.float32:
+        return queries @ codes.T
+    scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), chunk_size):
+        scores[:, start:start + chunk_size] = queries @ codes[start:start + chunk_size].astype(np.float32).T
+    return scores
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _assign_lists(embeddings: np.ndarray, centroids: np.ndarray, chunk_size: int = 16384) -> np.ndarray:
+    """Nearest centroid (cosine) of each normalized row, computed by chunks to bound memory."""
+    return np.concatenate([np.argmax(embeddings[start:start + chunk_size].astype(np.float32, copy=False) @ centroids.T, axis=1).astype(np.int32)
+                           for start in range(0, len(embeddings), chunk_size)] or [np.empty(0, dtype=np.int32)])
+
+
+def _train_centroids(sample: np.ndarray, n_lists: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Spherical k-means: centroids are re-normalized means of their assigned rows."""
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _assign_lists(sample, centroids)
+        counts = np.bincount(assignment, minlength=n_lists)
+        filled = counts > 0
+        order = np.argsort(assignment, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = _normalize(np.add.reduceat(sample[order], starts, axis=0))
+        # Liste vide : réensemencée sur un point au hasard pour ne pas perdre de capacité
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+    return centroids
+
+
+def _match_filter(value: Any, expected: FilterValue) -> bool:
+    if callable(expected):
+        return value is not None and bool(expected(value))
+    if isinstance(expected, (list, tuple, set, frozenset)):
+        return any(_match_filter(value, option) for option in expected)
+    if isinstance(value, (list, tuple)):
+        return any(_match_filter(item, expected) for item in value)
+    if isinstance(value, str) and isinstance(expected, str):
+        return value.casefold() == expected.casefold()
+    return value == expected
+
+
+def _read_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(path: str, manifest: Dict[str, Any]):
+    tmp_path = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(path, MANIFEST_FILE))
+
+
+def _append_segment(path: str, manifest: Dict[str, Any], embeddings: np.ndarray, records: List[Tuple[str, str, Dict[str, Any]]],
+                    codes: np.ndarray = None, scales: np.ndarray = None):
+    """Write a segment: float32 embeddings, metadata sidecar and, when quantized, the codes (and int8 scales)."""
+    name = f"segment_{manifest['next_segment']:05d}"
+    with open(os.path.join(path, name + ".f32"), "wb") as f:
+        np.ascontiguousarray(embeddings, dtype=np.float32).tofile(f)
+    with open(os.path.join(path, name + ".jsonl"), "w", encoding="utf-8") as f:
+        for _id, namespace, meta in records:
+            f.write(json.dumps({"id": _id, "namespace": namespace, "metadata": meta}, ensure_ascii=False) + "\n")
+    segment = {"name": name, "count": len(records)}
+    if codes is not None:
+        segment["dtype"] = codes.dtype.name
+        with open(os.path.join(path, name + STORAGE_DTYPES[segment["dtype"]]), "wb") as f:
+            np.ascontiguousarray(codes).tofile(f)
+    if scales is not None:
+        with open(os.path.join(path, name + SCALES_EXTENSION), "wb") as f:
+            np.ascontiguousarray(scales, dtype=np.float32).tofile(f)
+    manifest["next_segment"] += 1
+    manifest["segments"].append(segment)
+
+
+def _open_segment(path: str, segment: Dict[str, Any], dim: int) -> np.ndarray:
+    return np.memmap(os.path.join(path, segment["name"] + ".f32"), dtype=np.float32, mode="r", shape=(segment["count"], dim))
+
+
+def _open_codes(path: str, segment: Dict[str, Any], dim: int, dtype: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """Memory-mapped codes and scales of a segment, or (None, None) if it was saved with another dtype."""
+    if segment.get("dtype", "float32") != dtype:
+        return None, None
+    codes = np.memmap(os.path.join(path, segment["name"] + STORAGE_DTYPES[dtype]), dtype=dtype, mode="r", shape=(segment["count"], dim))
+    if dtype != "int8":
+        return codes, np.ones(segment["count"], dtype=np.float32)
+    return codes, np.fromfile(os.path.join(path, segment["name"] + SCALES_EXTENSION), dtype=np.float32, count=segment["count"])
+
+
+def initialize_vector_store(path: str = None, max_memory_bytes: int = None, dtype: str = "float32"):
+    """Open the index saved under ``path``, or initialize an empty one bound to it."""
+    if path and os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return SimpleIndex.load(path, max_memory_bytes=max_memory_bytes, dtype=dtype)
+    index = SimpleIndex(max_memory_bytes=max_memory_bytes, dtype=dtype)
+    index.path = path
+    return index
+
+
+def _format_segments(matches) -> str:
+    return "\n".join(metadata.get("segment_text", "") for _, _, metadata in matches)
+
 
-    def upsert(self, vectors):
-        for _id, embedding, metadata in vectors:
-            self.vectors.append({"id": _id, "embedding": embedding, "metadata": metadata})
+def retrieve_relevant_segments(query: str, index: SimpleIndex, embedding_model, k: int = 3, namespace: str = None, file_name: str = None) -> str:
+    """Embed the query once and return the text of the k most similar segments."""
+    with metrics.span("retrieval"):
+        return _format_segments(index.query(embedding_model.encode(query), k, namespace, file_name))
 
 
-def initialize_vector_store():
-    """Initialize an in-memory vector store."""
-    return SimpleIndex()
+def search_candidates(job_description: str, index: SimpleIndex, embedding_model, top_n: int = 10, nprobe: int = None,
+                      namespace: str = None, filters: Dict[str, FilterValue] = None) -> List[Dict[str, Any]]:
+    """Rank every indexed CV against a job description (IVF search once the corpus is large)."""
+    with metrics.span("candidate_search"):
+        index.ensure_ann()
+        return index.search_candidates(embedding_model.encode(job_description), top_n, nprobe=nprobe, namespace=namespace, filters=filters)
 
 
-def retrieve_relevant_segments(query: str, index: SimpleIndex, k: int = 3) -> str:
-    """Retrieve segments that were inserted. This stub simply returns the first k segments."""
-    texts = [entry["metadata"].get("segment_text", "") for entry in index.vectors[:k]]
-    return "\n".join(texts)
+def retrieve_relevant_segments_batch(queries: List[str], index: SimpleIndex, embedding_model, k: int = 3, namespace: str = None) -> List[str]:
+    """Retrieve the top-k segments for many queries (e.g. job descriptions) at once."""
+    if not queries:
+        return []
+    with metrics.span("retrieval"):
+        return [_format_segments(matches) for matches in index.query_batch(embedding_model.encode(queries), k, namespace)]